@@ -5,3 +5,8 @@ class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
     verbose_name = 'Управление API'
+
+    def ready(self):
+        from api import checks, signals  # noqa: F401
+        from api.utils.utils import register_fonts
+        register_fonts()
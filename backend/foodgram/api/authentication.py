@@ -0,0 +1,39 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.authentication import TokenAuthentication
+
+
+def get_token_cache():
+    return caches[settings.AUTH_TOKEN_CACHE_ALIAS]
+
+
+def get_token_cache_key(key):
+    # Сам токен в ключ кэша не попадает: общий кэш может быть доступен
+    # не только приложению.
+    return 'auth_token:' + hashlib.sha256(key.encode()).hexdigest()
+
+
+def invalidate_tokens(keys):
+    get_token_cache().delete_many(
+        [get_token_cache_key(key) for key in keys]
+    )
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication, запоминающая токен вместе с пользователем.
+
+    Записи живут в кэше AUTH_TOKEN_CACHE_ALIAS (ограниченный по размеру
+    LocMemCache или общий бэкенд) не дольше его TIMEOUT и удаляются при
+    выходе, удалении токена и сохранении пользователя.
+    """
+
+    def authenticate_credentials(self, key):
+        cache = get_token_cache()
+        cache_key = get_token_cache_key(key)
+        token = cache.get(cache_key)
+        if token is None:
+            user, token = super().authenticate_credentials(key)
+            cache.set(cache_key, token)
+        return token.user, token
@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+from api.utils.search import is_cache_shared
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """Версии индексов и справочников должны быть видны всем процессам."""
+    if settings.DEBUG or is_cache_shared():
+        return []
+    return [
+        Warning(
+            'Кэш default хранится в памяти одного процесса: изменения '
+            'тегов, ингредиентов и рецептов не сбрасывают индексы в других '
+            'воркерах и после команд управления.',
+            hint='Укажите общий кэш в CACHE_BACKEND и CACHE_LOCATION, '
+                 'например django.core.cache.backends.memcached.'
+                 'PyMemcacheCache.',
+            obj=settings.CACHES['default']['BACKEND'],
+            id='api.W001',
+        )
+    ]
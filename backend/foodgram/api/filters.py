@@ -1,40 +1,99 @@
+from django.db.models import F
 from django_filters.rest_framework import (
     BooleanFilter,
     CharFilter,
     FilterSet,
-    ModelMultipleChoiceFilter
+    MultipleChoiceFilter,
+    OrderingFilter
 )
 from rest_framework.filters import SearchFilter
 
-from recipes.models import Recipe, Tag
+from api.utils.cart import SessionCart
+from api.utils.search import ingredient_index
+from api.utils.tags import get_tag_choices, tag_cache
+from recipes.models import Recipe
+from recipes.search import search_recipes
 
 
 class IngredientFilter(SearchFilter):
+    """Поиск ингредиентов по названию через индекс в памяти процесса."""
     search_param = 'name'
 
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '')
+        if view.action != 'list' or not query.strip():
+            return queryset
+        return ingredient_index.search(query)
+
 
 class RecipeFilter(FilterSet):
     author = CharFilter()
-    tags = ModelMultipleChoiceFilter(
-        field_name='tags__slug',
-        queryset=Tag.objects.all(),
+    tags = MultipleChoiceFilter(
+        choices=get_tag_choices,
         label='Tags',
-        to_field_name='slug'
+        method='get_tags',
     )
     is_favorited = BooleanFilter(method='get_favorite')
     is_in_shopping_cart = BooleanFilter(
         method='get_is_in_shopping_cart')
+    search = CharFilter(method='get_search')
+    ordering = OrderingFilter(
+        fields=('favorites_count', 'in_carts_count', 'pub_date'),
+        method='get_ordering',
+    )
 
     class Meta:
         model = Recipe
-        fields = ['tags', 'author', 'is_favorited', 'is_in_shopping_cart']
+        fields = [
+            'tags',
+            'author',
+            'is_favorited',
+            'is_in_shopping_cart',
+            'search',
+            'ordering',
+        ]
+
+    def get_tags(self, queryset, name, value):
+        if not value:
+            return queryset
+        mask = tag_cache.get_mask(value)
+        if mask is None:
+            return queryset.filter(
+                id__in=Recipe.tags.through.objects.filter(
+                    tag__slug__in=value
+                ).values('recipe_id')
+            )
+        masks = tag_cache.get_matching_masks(mask)
+        if masks is None:
+            return queryset.annotate(
+                matching_tags=F('tags_mask').bitand(mask)
+            ).exclude(matching_tags=0)
+        return queryset.filter(tags_mask__in=masks)
 
     def get_favorite(self, queryset, name, value):
-        if value:
-            return queryset.filter(favorites__user=self.request.user)
-        return queryset
+        if not value:
+            return queryset
+        if not self.request.user.is_authenticated:
+            return queryset.none()
+        return queryset.filter(favorites__user=self.request.user)
 
     def get_is_in_shopping_cart(self, queryset, name, value):
-        if value:
-            return queryset.filter(shopping_carts__user=self.request.user)
+        if not value:
+            return queryset
+        if not self.request.user.is_authenticated:
+            return queryset.filter(
+                id__in=SessionCart(self.request.session).recipe_ids
+            )
+        return queryset.filter(shopping_carts__user=self.request.user)
+
+    def get_search(self, queryset, name, value):
+        if value.strip():
+            return search_recipes(queryset, value)
         return queryset
+
+    def get_ordering(self, queryset, name, value):
+        """Сортировка по популярности или дате; id делает порядок
+        однозначным для постраничного вывода."""
+        if not value:
+            return queryset
+        return queryset.order_by(*value, '-id')
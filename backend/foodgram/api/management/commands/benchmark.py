@@ -0,0 +1,623 @@
+import base64
+import io
+import json
+import os
+import shutil
+import statistics
+import tempfile
+from itertools import combinations
+from time import perf_counter
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (CaptureQueriesContext, override_settings,
+                               setup_databases, setup_test_environment,
+                               teardown_databases, teardown_test_environment)
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from users.models import Follow, User
+
+PASSWORD = "Benchmark-password-1"
+NEW_PASSWORD = "Benchmark-password-2"
+RECIPE_FILTERS = {
+    "tags": "tags={tag}&tags={other_tag}",
+    "author": "author={author}",
+    "search": "search=суп",
+    "ordering": "ordering=-favorites_count",
+    "is_favorited": "is_favorited=1",
+    "is_in_shopping_cart": "is_in_shopping_cart=1",
+}
+USER_FILTERS = ("is_favorited", "is_in_shopping_cart")
+# Подсчёт, страница рецептов, теги, ингредиенты и авторы с подписками.
+RECIPE_LIST_BUDGET = 5
+ANONYMOUS_RECIPE_LIST_BUDGET = 4
+DEFAULT_OUTPUT = os.path.join(
+    tempfile.gettempdir(), "foodgram-benchmark-results.json"
+)
+DEFAULT_BASELINE = settings.BASE_DIR / "benchmarks" / "baseline.json"
+DATASET_KEYS = ("vendor", "users", "recipes", "seed")
+
+
+class Scenario:
+    """Запрос, который измеряется repeat раз.
+
+    setup вызывается перед каждым запросом и может вернуть значения для
+    подстановки в url; teardown возвращает данные в исходное состояние.
+    Ни то, ни другое не входит в измерение.
+    """
+
+    def __init__(self, name, method, url, budget, client="user", data=None,
+                 status=200, setup=None, teardown=None, settings=None):
+        self.name = name
+        self.method = method
+        self.url = url
+        self.budget = budget
+        self.client = client
+        self.data = data
+        self.status = status
+        self.setup = setup
+        self.teardown = teardown
+        self.settings = settings or {}
+
+
+def make_image():
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 64), "#e0c9a6").save(buffer, "PNG")
+    return (
+        "data:image/png;base64,"
+        + base64.b64encode(buffer.getvalue()).decode()
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Замеряет время ответа и число запросов к базе для всех маршрутов "
+        "API на фиксированном наборе данных во временной тестовой базе. "
+        "Результаты пишутся в JSON; команда завершается ошибкой, если "
+        "представление превысило бюджет запросов или замедлилось "
+        "относительно сохранённого базового замера"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--users", type=int, default=200,
+            help="Количество пользователей в наборе данных",
+        )
+        parser.add_argument(
+            "--recipes", type=int, default=2000,
+            help="Количество рецептов в наборе данных",
+        )
+        parser.add_argument(
+            "--seed", type=int, default=0,
+            help="Значение --seed для generate_fake_data",
+        )
+        parser.add_argument(
+            "--repeat", type=int, default=10,
+            help="Сколько раз измерять каждый запрос",
+        )
+        parser.add_argument(
+            "--output", default=DEFAULT_OUTPUT,
+            help="Файл для результатов в формате JSON, по умолчанию во "
+                 "временном каталоге",
+        )
+        parser.add_argument(
+            "--baseline", default=DEFAULT_BASELINE,
+            help="Файл базового замера для сравнения",
+        )
+        parser.add_argument(
+            "--queries-only", action="store_true",
+            help="Сравнивать с базовым замером только число запросов, "
+                 "без времени (для CI на другом железе)",
+        )
+        parser.add_argument(
+            "--save-baseline", action="store_true",
+            help="Сохранить результаты как базовый замер",
+        )
+        parser.add_argument(
+            "--threshold", type=float, default=1.5,
+            help="Во сколько раз медиана может превысить базовую",
+        )
+        parser.add_argument(
+            "--min-delta", type=float, default=5,
+            help="Замедление в мс, которое не считается регрессией",
+        )
+        parser.add_argument(
+            "--filter",
+            help="Запускать только сценарии, в названии которых есть строка",
+        )
+
+    def handle(self, *args, **options):
+        self.verbosity = options["verbosity"]
+        self.repeat = options["repeat"]
+        if self.repeat < 1:
+            raise CommandError("--repeat должно быть положительным")
+        media_root = tempfile.mkdtemp(prefix="foodgram-benchmark-")
+        setup_test_environment()
+        old_config = setup_databases(
+            verbosity=0, interactive=False, aliases={"default"}
+        )
+        try:
+            # Картинки обрабатываются сразу: фоновые потоки мешали бы
+            # замерам и не работают с SQLite в памяти.
+            with override_settings(
+                MEDIA_ROOT=media_root, IMAGE_PIPELINE_WORKERS=0
+            ):
+                self.seed(options)
+                results = self.run_scenarios(options["filter"])
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+            shutil.rmtree(media_root, ignore_errors=True)
+        report = {
+            "vendor": connection.vendor,
+            "users": options["users"],
+            "recipes": options["recipes"],
+            "seed": options["seed"],
+            "repeat": self.repeat,
+            "results": results,
+        }
+        self.write_json(options["output"], report)
+        if options["save_baseline"]:
+            self.write_json(options["baseline"], report)
+        failures = self.check_budgets(results)
+        if not options["save_baseline"]:
+            failures += self.check_baseline(
+                report,
+                options["baseline"],
+                options["threshold"],
+                options["min_delta"],
+                options["queries_only"],
+            )
+        if failures:
+            raise CommandError(
+                "Замер не пройден:\n" + "\n".join(failures)
+            )
+        if self.verbosity > 0:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Сценариев: {len(results)}, "
+                    f"результаты в {options['output']}"
+                )
+            )
+
+    def write_json(self, path, data):
+        with open(path, "wt", encoding="utf-8") as file:
+            json.dump(data, file, ensure_ascii=False, indent=2)
+
+    def seed(self, options):
+        call_command(
+            "load_data",
+            ingredients="data/ingredients.json",
+            tags="data/tags.json",
+            verbosity=0,
+        )
+        call_command(
+            "generate_fake_data",
+            users=options["users"],
+            recipes=options["recipes"],
+            seed=options["seed"],
+            verbosity=0,
+        )
+        fake_users = User.objects.filter(username__startswith="fake")
+        user = fake_users.filter(
+            favorites__isnull=False,
+            shopping_carts__isnull=False,
+            followers__isnull=False,
+        ).order_by("id").first()
+        if user is None:
+            raise CommandError(
+                "В наборе данных нет пользователя с избранным, покупками "
+                "и подписками; увеличьте --users и --recipes"
+            )
+        author = fake_users.exclude(pk=user.pk).order_by(
+            "-recipes_count", "id"
+        ).first()
+        user.set_password(PASSWORD)
+        user.save()
+        staff = User.objects.create_user(
+            username="benchmark_staff",
+            email="benchmark_staff@example.com",
+            password=PASSWORD,
+            is_staff=True,
+        )
+        guest = User.objects.create_user(
+            username="benchmark_guest",
+            email="benchmark_guest@example.com",
+            password=PASSWORD,
+        )
+        self.clients = {"anonymous": APIClient()}
+        self.tokens = {}
+        for name, client_user in (
+            ("user", user), ("staff", staff), ("guest", guest)
+        ):
+            self.tokens[name] = Token.objects.create(user=client_user).key
+            self.clients[name] = APIClient()
+            self.clients[name].credentials(
+                HTTP_AUTHORIZATION=f"Token {self.tokens[name]}"
+            )
+        self.user, self.guest = user, guest
+        tags = list(Tag.objects.order_by("id").values_list("slug", flat=True))
+        recipe = Recipe.objects.order_by("-favorites_count", "id").first()
+        free_recipes = list(
+            Recipe.objects.exclude(favorites__user=user).exclude(
+                shopping_carts__user=user
+            ).order_by("id").values_list("id", flat=True)[:10]
+        )
+        ingredients = list(
+            Ingredient.objects.order_by("id").values_list("id", flat=True)[:3]
+        )
+        self.recipe_data = {
+            "name": "Суп для замера",
+            "text": "Сварите суп.",
+            "cooking_time": 30,
+            "image": make_image(),
+            "tags": list(Tag.objects.values_list("id", flat=True)[:2]),
+            "ingredients": [
+                {"id": pk, "amount": amount}
+                for amount, pk in enumerate(ingredients, 1)
+            ],
+        }
+        response = self.clients["user"].post(
+            "/api/recipes/", self.recipe_data, format="json"
+        )
+        if response.status_code != 201:
+            raise CommandError(f"Не удалось создать рецепт: {response.data}")
+        self.fixture = {
+            "user": user.pk,
+            "author": author.pk,
+            "tag": tags[0],
+            "other_tag": tags[-1],
+            "tag_id": Tag.objects.get(slug=tags[0]).pk,
+            "ingredient": ingredients[0],
+            "ingredient_name": Ingredient.objects.get(
+                pk=ingredients[0]
+            ).name[:3],
+            "recipe": recipe.pk,
+            "own_recipe": response.data["id"],
+            "free_recipe": free_recipes[0],
+            "free_recipes": free_recipes,
+        }
+
+    def get_scenarios(self):
+        scenarios = [
+            Scenario(
+                "auth.login", "post", "/api/auth/token/login/", 4,
+                client="anonymous",
+                data={"email": self.guest.email, "password": PASSWORD},
+            ),
+            Scenario(
+                "auth.logout", "post", "/api/auth/token/logout/", 4,
+                client="guest", status=204,
+                setup=self.restore_guest_token,
+            ),
+            Scenario("users.list", "get", "/api/users/", 3),
+            Scenario("users.detail", "get", "/api/users/{author}/", 2),
+            Scenario("users.me", "get", "/api/users/me/", 1),
+            Scenario(
+                "users.set_password", "post", "/api/users/set_password/", 3,
+                status=204,
+                data={
+                    "current_password": PASSWORD,
+                    "new_password": NEW_PASSWORD,
+                },
+                teardown=self.restore_password,
+            ),
+            Scenario(
+                "users.subscriptions", "get",
+                "/api/users/subscriptions/?recipes_limit=3", 3,
+            ),
+            Scenario(
+                "users.subscribe", "post", "/api/users/{author}/subscribe/",
+                8, status=201, teardown=self.unsubscribe,
+            ),
+            Scenario(
+                "users.unsubscribe", "delete",
+                "/api/users/{author}/subscribe/", 8,
+                status=204, setup=self.subscribe,
+            ),
+            Scenario(
+                "performance", "get", "/api/performance/", 0,
+                client="staff",
+            ),
+            Scenario("tags.list", "get", "/api/tags/", 0),
+            Scenario("tags.detail", "get", "/api/tags/{tag_id}/", 1),
+            Scenario("ingredients.list", "get", "/api/ingredients/", 0),
+            Scenario(
+                "ingredients.search", "get",
+                "/api/ingredients/?name={ingredient_name}", 0,
+            ),
+            Scenario(
+                "ingredients.detail", "get",
+                "/api/ingredients/{ingredient}/", 1,
+            ),
+            Scenario(
+                "recipes.list.anonymous", "get", "/api/recipes/",
+                ANONYMOUS_RECIPE_LIST_BUDGET,
+                client="anonymous",
+            ),
+            Scenario(
+                "recipes.list.cursor", "get", "/api/recipes/?cursor=", 4,
+            ),
+            Scenario(
+                "recipes.list.page", "get", "/api/recipes/?page=20",
+                RECIPE_LIST_BUDGET,
+            ),
+            Scenario(
+                "recipes.detail", "get", "/api/recipes/{recipe}/", 4,
+            ),
+            Scenario(
+                "recipes.detail.anonymous", "get", "/api/recipes/{recipe}/",
+                3, client="anonymous",
+            ),
+            Scenario(
+                "recipes.create", "post", "/api/recipes/", 14, status=201,
+                data=self.recipe_data, teardown=self.delete_created_recipe,
+            ),
+            Scenario(
+                "recipes.update", "patch", "/api/recipes/{own_recipe}/", 11,
+                data={
+                    "ingredients": [
+                        {"id": self.fixture["ingredient"], "amount": 5}
+                    ],
+                },
+            ),
+            Scenario(
+                "recipes.delete", "delete", "/api/recipes/{created}/", 13,
+                status=204, setup=self.create_recipe,
+            ),
+            Scenario(
+                "recipes.pantry", "get",
+                "/api/recipes/pantry/?ingredients={ingredient}"
+                "&max_missing=10", 4,
+            ),
+            Scenario(
+                "recipes.favorite.add", "post",
+                "/api/recipes/{free_recipe}/favorite/", 7, status=201,
+                teardown=self.remove_favorites,
+            ),
+            Scenario(
+                "recipes.favorite.remove", "delete",
+                "/api/recipes/{free_recipe}/favorite/", 8, status=204,
+                setup=self.add_favorites,
+            ),
+            Scenario(
+                "recipes.favorite_batch.add", "post",
+                "/api/recipes/favorite/", 4,
+                data={"recipes": self.fixture["free_recipes"]},
+                teardown=self.remove_favorites,
+            ),
+            Scenario(
+                "recipes.favorite_batch.remove", "delete",
+                "/api/recipes/favorite/", 4,
+                data={"recipes": self.fixture["free_recipes"]},
+                setup=self.add_favorites,
+            ),
+            Scenario(
+                "recipes.shopping_cart.add", "post",
+                "/api/recipes/{free_recipe}/shopping_cart/", 10,
+                status=201, teardown=self.remove_from_cart,
+            ),
+            Scenario(
+                "recipes.shopping_cart.remove", "delete",
+                "/api/recipes/{free_recipe}/shopping_cart/", 11,
+                status=204, setup=self.add_to_cart,
+            ),
+            Scenario(
+                "recipes.shopping_cart.anonymous", "post",
+                "/api/recipes/{free_recipe}/shopping_cart/", 3,
+                client="anonymous", status=201,
+                teardown=self.remove_from_session_cart,
+            ),
+            Scenario(
+                "recipes.shopping_cart_batch.add", "post",
+                "/api/recipes/shopping_cart/", 7,
+                data={"recipes": self.fixture["free_recipes"]},
+                teardown=self.remove_from_cart,
+            ),
+            Scenario(
+                "recipes.shopping_cart_batch.remove", "delete",
+                "/api/recipes/shopping_cart/", 7,
+                data={"recipes": self.fixture["free_recipes"]},
+                setup=self.add_to_cart,
+            ),
+            Scenario(
+                "recipes.download_shopping_cart", "get",
+                "/api/recipes/download_shopping_cart/", 1,
+                settings={"SHOPPING_LIST_CACHE_TIMEOUT": 0},
+            ),
+            Scenario(
+                "recipes.download_shopping_cart.anonymous", "get",
+                "/api/recipes/download_shopping_cart/", 0,
+                client="anonymous",
+                settings={"SHOPPING_LIST_CACHE_TIMEOUT": 0},
+            ),
+        ]
+        for size in range(1, len(RECIPE_FILTERS) + 1):
+            for names in combinations(RECIPE_FILTERS, size):
+                query = "&".join(RECIPE_FILTERS[name] for name in names)
+                scenarios.append(Scenario(
+                    f"recipes.list?{'+'.join(names)}", "get",
+                    f"/api/recipes/?{query}", RECIPE_LIST_BUDGET,
+                ))
+                if not set(names) & set(USER_FILTERS):
+                    scenarios.append(Scenario(
+                        f"recipes.list.anonymous?{'+'.join(names)}", "get",
+                        f"/api/recipes/?{query}",
+                        ANONYMOUS_RECIPE_LIST_BUDGET,
+                        client="anonymous",
+                    ))
+        return scenarios
+
+    def restore_guest_token(self):
+        Token.objects.get_or_create(
+            user=self.guest, key=self.tokens["guest"]
+        )
+
+    def restore_password(self, response):
+        self.user.set_password(PASSWORD)
+        self.user.save()
+
+    def subscribe(self):
+        Follow.objects.get_or_create(
+            user=self.user, author_id=self.fixture["author"]
+        )
+
+    def unsubscribe(self, response):
+        Follow.objects.filter(
+            user=self.user, author_id=self.fixture["author"]
+        ).delete()
+
+    def create_recipe(self):
+        response = self.clients["user"].post(
+            "/api/recipes/", self.recipe_data, format="json"
+        )
+        return {"created": response.data["id"]}
+
+    def delete_created_recipe(self, response):
+        Recipe.objects.filter(pk=response.data["id"]).delete()
+
+    def add_favorites(self):
+        Favorite.objects.add_for_user(
+            self.user.pk, self.fixture["free_recipes"]
+        )
+
+    def remove_favorites(self, response):
+        Favorite.objects.remove_for_user(
+            self.user.pk, self.fixture["free_recipes"]
+        )
+
+    def add_to_cart(self):
+        ShoppingCart.objects.add_for_user(
+            self.user.pk, self.fixture["free_recipes"]
+        )
+
+    def remove_from_cart(self, response):
+        ShoppingCart.objects.remove_for_user(
+            self.user.pk, self.fixture["free_recipes"]
+        )
+
+    def remove_from_session_cart(self, response):
+        self.clients["anonymous"].delete(
+            f"/api/recipes/{self.fixture['free_recipe']}/shopping_cart/"
+        )
+
+    def measure(self, scenario):
+        client = self.clients[scenario.client]
+        url_kwargs = scenario.setup() if scenario.setup else None
+        url = scenario.url.format(**self.fixture, **(url_kwargs or {}))
+        with override_settings(**scenario.settings), \
+                CaptureQueriesContext(connection) as queries:
+            started = perf_counter()
+            if scenario.data is None:
+                response = getattr(client, scenario.method)(url)
+            else:
+                response = getattr(client, scenario.method)(
+                    url, scenario.data, format="json"
+                )
+            if response.streaming:
+                b"".join(response.streaming_content)
+            duration = (perf_counter() - started) * 1000
+            # Список запросов читается из connection.queries лениво, а
+            # teardown может выполнить свой запрос и сбросить журнал.
+            query_count = len(queries)
+        if response.status_code != scenario.status:
+            raise CommandError(
+                f"{scenario.name}: {scenario.method.upper()} {url} вернул "
+                f"{response.status_code} вместо {scenario.status}"
+            )
+        if scenario.teardown:
+            scenario.teardown(response)
+        return duration, query_count
+
+    def run_scenarios(self, name_filter):
+        results = {}
+        for scenario in self.get_scenarios():
+            if name_filter and name_filter not in scenario.name:
+                continue
+            # Первый запрос прогревает кэши процесса и не учитывается.
+            self.measure(scenario)
+            durations, query_counts = zip(*(
+                self.measure(scenario) for _ in range(self.repeat)
+            ))
+            durations = sorted(durations)
+            results[scenario.name] = {
+                "method": scenario.method.upper(),
+                "url": scenario.url,
+                "queries": max(query_counts),
+                "budget": scenario.budget,
+                "median_ms": round(statistics.median(durations), 2),
+                "p95_ms": round(
+                    durations[max(round(len(durations) * 0.95) - 1, 0)], 2
+                ),
+                "min_ms": round(durations[0], 2),
+            }
+            if self.verbosity > 1:
+                result = results[scenario.name]
+                self.stdout.write(
+                    f"{scenario.name}: {result['median_ms']} мс, "
+                    f"запросов {result['queries']}/{scenario.budget}"
+                )
+        return results
+
+    def check_budgets(self, results):
+        return [
+            f"{name}: {result['queries']} запросов при бюджете "
+            f"{result['budget']}"
+            for name, result in results.items()
+            if result["queries"] > result["budget"]
+        ]
+
+    def load_baseline(self, path, report):
+        """Результаты базового замера или None, если его нет или он снят
+        на другом наборе данных."""
+        try:
+            with open(path, "rt", encoding="utf-8") as file:
+                baseline = json.load(file)
+        except FileNotFoundError:
+            problem = "не найден"
+        else:
+            changed = [
+                key for key in DATASET_KEYS
+                if baseline.get(key) != report[key]
+            ]
+            if not changed:
+                return baseline["results"]
+            problem = f"снят на другом наборе данных ({', '.join(changed)})"
+        if self.verbosity > 0:
+            self.stderr.write(
+                f"Базовый замер {path} {problem}, сравнение пропущено"
+            )
+        return None
+
+    def check_baseline(self, report, path, threshold, min_delta,
+                       queries_only):
+        baseline = self.load_baseline(path, report)
+        if baseline is None:
+            return []
+        failures = []
+        for name, result in report["results"].items():
+            base = baseline.get(name)
+            if base is None:
+                continue
+            if result["queries"] > base["queries"]:
+                failures.append(
+                    f"{name}: {result['queries']} запросов, "
+                    f"в базовом замере {base['queries']}"
+                )
+            if queries_only:
+                continue
+            median, base_median = result["median_ms"], base["median_ms"]
+            if (
+                median > base_median * threshold
+                and median - base_median > min_delta
+            ):
+                failures.append(
+                    f"{name}: медиана {median} мс, "
+                    f"в базовом замере {base_median} мс"
+                )
+        return failures
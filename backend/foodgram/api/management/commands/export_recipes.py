@@ -0,0 +1,85 @@
+import json
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+from api.management.commands.load_data import iter_batches
+from recipes.models import Recipe, RecipeIngredient
+
+
+class Command(BaseCommand):
+    help = (
+        "Выгружает рецепты с ингредиентами, тегами и ссылками на картинки "
+        "в формате NDJSON (один рецепт в строке)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--output",
+            default="-",
+            help="Путь к файлу NDJSON, по умолчанию стандартный вывод",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=2000,
+            help="Количество рецептов, читаемых из базы за один раз",
+        )
+
+    def handle(self, *args, **options):
+        if options["output"] == "-":
+            total = self.export(self.stdout, options["chunk_size"])
+        else:
+            with open(options["output"], "wt", encoding="utf-8") as file:
+                total = self.export(file, options["chunk_size"])
+        if options["verbosity"] > 0:
+            self.stderr.write(
+                self.style.SUCCESS(f"Выгружено рецептов: {total}")
+            )
+
+    def export(self, file, chunk_size):
+        recipes = Recipe.objects.order_by("id").values(
+            "id",
+            "name",
+            "text",
+            "cooking_time",
+            "pub_date",
+            "image",
+            "image_thumbnail",
+            "image_webp",
+            author_email=F("author__email"),
+        ).iterator(chunk_size=chunk_size)
+        total = 0
+        for batch in iter_batches(recipes, chunk_size):
+            recipe_ids = [recipe["id"] for recipe in batch]
+            ingredients = defaultdict(list)
+            for recipe_id, name, measurement_unit, amount in (
+                RecipeIngredient.objects.filter(
+                    recipe_id__in=recipe_ids
+                ).order_by("id").values_list(
+                    "recipe_id",
+                    "ingredient__name",
+                    "ingredient__measurement_unit",
+                    "amount",
+                )
+            ):
+                ingredients[recipe_id].append({
+                    "name": name,
+                    "measurement_unit": measurement_unit,
+                    "amount": amount,
+                })
+            tags = defaultdict(list)
+            for recipe_id, slug in Recipe.tags.through.objects.filter(
+                recipe_id__in=recipe_ids
+            ).order_by("id").values_list("recipe_id", "tag__slug"):
+                tags[recipe_id].append(slug)
+            for recipe in batch:
+                recipe_id = recipe.pop("id")
+                recipe["author"] = recipe.pop("author_email")
+                recipe["pub_date"] = recipe["pub_date"].isoformat()
+                recipe["tags"] = tags[recipe_id]
+                recipe["ingredients"] = ingredients[recipe_id]
+                file.write(json.dumps(recipe, ensure_ascii=False) + "\n")
+            total += len(batch)
+        return total
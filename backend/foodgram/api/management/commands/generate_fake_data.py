@@ -0,0 +1,352 @@
+import io
+import random
+from bisect import bisect
+from collections import Counter
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+from PIL import Image
+
+from api.management.commands.load_data import (bulk_create_with_pks,
+                                               invalidate_indexes,
+                                               iter_batches)
+from api.utils.pantry import recipe_ingredient_index
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, ShoppingListItem, Tag)
+from recipes.search import bulk_update_search_index
+from users.models import Follow, User
+
+PLACEHOLDER_IMAGE = "recipes/images/fake_data.png"
+FIRST_NAMES = (
+    "Анна", "Мария", "Елена", "Ольга", "Дарья", "Иван", "Пётр", "Алексей",
+    "Сергей", "Дмитрий", "Никита", "Софья",
+)
+LAST_NAMES = (
+    "Иванова", "Смирнова", "Кузнецова", "Попов", "Васильев", "Петров",
+    "Соколов", "Морозова", "Волков", "Лебедева",
+)
+ADJECTIVES = (
+    "Домашний", "Быстрый", "Летний", "Пряный", "Нежный", "Сытный",
+    "Острый", "Бабушкин", "Постный", "Праздничный",
+)
+DISHES = (
+    "суп", "салат", "пирог", "плов", "омлет", "рагу", "борщ", "соус",
+    "гуляш", "десерт", "хлеб", "ризотто",
+)
+STEPS = (
+    "Нарежьте овощи.", "Доведите до кипения.", "Посолите и поперчите.",
+    "Обжарьте на среднем огне.", "Перемешайте и накройте крышкой.",
+    "Запекайте до золотистой корочки.", "Подавайте горячим.",
+    "Оставьте настояться на десять минут.", "Украсьте зеленью.",
+)
+AMOUNTS = (1, 2, 3, 5, 10, 20, 50, 100, 150, 200, 250, 300, 500, 1000)
+
+
+class ZipfSampler:
+    """Выбор из items с вероятностью, обратной рангу в степени exponent.
+
+    Ранги случайно перемешаны, чтобы популярность не зависела от порядка
+    создания объектов.
+    """
+
+    def __init__(self, rng, items, exponent):
+        self.rng = rng
+        self.items = list(items)
+        rng.shuffle(self.items)
+        self.cum_weights = list(accumulate(
+            1 / rank ** exponent for rank in range(1, len(self.items) + 1)
+        ))
+
+    def sample(self, k):
+        if not k:
+            return []
+        total = self.cum_weights[-1]
+        return [
+            self.items[bisect(self.cum_weights, self.rng.random() * total)]
+            for _ in range(k)
+        ]
+
+    def sample_unique(self, k):
+        return sorted(set(self.sample(k)))
+
+
+class Command(BaseCommand):
+    help = (
+        "Создаёт тестовых пользователей, рецепты, избранное, списки покупок "
+        "и подписки для нагрузочного тестирования. Популярность рецептов и "
+        "авторов распределена по закону Ципфа, результат определяется "
+        "значением --seed. Ингредиенты и теги должны быть загружены"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--users", type=int, default=1000,
+            help="Количество пользователей",
+        )
+        parser.add_argument(
+            "--recipes", type=int, default=10000,
+            help="Количество рецептов",
+        )
+        parser.add_argument(
+            "--favorites", type=float, default=20,
+            help="Среднее число избранных рецептов у пользователя",
+        )
+        parser.add_argument(
+            "--carts", type=float, default=3,
+            help="Среднее число рецептов в списке покупок",
+        )
+        parser.add_argument(
+            "--follows", type=float, default=10,
+            help="Среднее число подписок у пользователя",
+        )
+        parser.add_argument(
+            "--zipf-exponent", type=float, default=1.1,
+            help="Показатель распределения Ципфа для популярности",
+        )
+        parser.add_argument(
+            "--seed", type=int, default=0,
+            help="Начальное значение генератора случайных чисел",
+        )
+        parser.add_argument(
+            "--password", default="fake-password",
+            help="Пароль всех созданных пользователей",
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=5000,
+            help="Количество строк в одной пачке вставки",
+        )
+
+    def handle(self, *args, **options):
+        self.verbosity = options["verbosity"]
+        self.seed = options["seed"]
+        self.exponent = options["zipf_exponent"]
+        self.batch_size = options["batch_size"]
+        n_users, n_recipes = options["users"], options["recipes"]
+        if n_users < 1 or n_recipes < 0:
+            raise CommandError(
+                "--users должно быть положительным, --recipes неотрицательным"
+            )
+        self.tag_bits = dict(Tag.objects.order_by("id").values_list(
+            "id", "bit"
+        ))
+        self.tags = list(self.tag_bits)
+        self.ingredients = list(Ingredient.objects.order_by("id").values_list(
+            "id", flat=True
+        ))
+        if not self.tags or not self.ingredients:
+            raise CommandError(
+                "Сначала загрузите ингредиенты и теги командой load_data"
+            )
+        self.username_prefix = f"fake{self.seed}_"
+        if User.objects.filter(
+            username__startswith=self.username_prefix
+        ).exists():
+            raise CommandError(
+                f"Данные с --seed {self.seed} уже созданы, "
+                f"укажите другое значение"
+            )
+        # Связи строятся по индексам объектов дважды с одинаковым
+        # зерном: первый проход считает денормализованные счётчики до
+        # вставки, второй создаёт строки, не держа граф в памяти.
+        graphs = (
+            (Follow, "follows", "author", n_users, True),
+            (Favorite, "favorites", "recipe", n_recipes, False),
+            (ShoppingCart, "carts", "recipe", n_recipes, False),
+        )
+        counts = {
+            name: Counter(
+                item for _, item in self.iter_graph(
+                    name, n_users, n_items, options[name], exclude_self
+                )
+            )
+            for _, name, _, n_items, exclude_self in graphs
+        }
+        authors = ZipfSampler(
+            random.Random(f"{self.seed}:authors"),
+            range(n_users),
+            self.exponent,
+        ).sample(n_recipes)
+        user_ids = self.create_users(
+            n_users, options["password"], Counter(authors), counts["follows"]
+        )
+        recipe_ids = self.create_recipes(
+            [user_ids[author] for author in authors],
+            counts["favorites"],
+            counts["carts"],
+        )
+        stats = Counter(users=len(user_ids), recipes=len(recipe_ids))
+        for model, name, field, n_items, exclude_self in graphs:
+            item_ids = user_ids if model is Follow else recipe_ids
+            pairs = self.iter_graph(
+                name, n_users, n_items, options[name], exclude_self
+            )
+            for batch in iter_batches(pairs, self.batch_size):
+                model.objects.bulk_create([
+                    model(user_id=user_ids[user], **{
+                        f"{field}_id": item_ids[item]
+                    })
+                    for user, item in batch
+                ])
+                stats[name] += len(batch)
+        stats["shopping_list_items"] = self.create_shopping_lists(user_ids)
+        invalidate_indexes(self, recipe_ingredient_index)
+        if self.verbosity > 0:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    ", ".join(f"{name}: {total}" for name, total in
+                              stats.items())
+                )
+            )
+
+    def iter_graph(self, name, n_users, n_items, mean, exclude_self):
+        """Пары (индекс пользователя, индекс объекта) без повторов; число
+        связей пользователя распределено экспоненциально со средним
+        mean."""
+        if not n_items or mean <= 0:
+            return
+        rng = random.Random(f"{self.seed}:{name}")
+        sampler = ZipfSampler(rng, range(n_items), self.exponent)
+        for user in range(n_users):
+            k = min(round(rng.expovariate(1 / mean)), n_items)
+            for item in sampler.sample_unique(k):
+                if not (exclude_self and item == user):
+                    yield user, item
+
+    def create_users(self, n_users, password, recipes_count,
+                     followers_count):
+        rng = random.Random(f"{self.seed}:users")
+        password = make_password(password)
+        user_ids = []
+        for batch in iter_batches(range(n_users), self.batch_size):
+            users = [
+                User(
+                    username=f"{self.username_prefix}{index}",
+                    email=f"{self.username_prefix}{index}@example.com",
+                    first_name=rng.choice(FIRST_NAMES),
+                    last_name=rng.choice(LAST_NAMES),
+                    password=password,
+                    recipes_count=recipes_count[index],
+                    followers_count=followers_count[index],
+                )
+                for index in batch
+            ]
+            with transaction.atomic():
+                bulk_create_with_pks(User, users)
+            user_ids += [user.pk for user in users]
+        return user_ids
+
+    def get_placeholder_image(self):
+        if not default_storage.exists(PLACEHOLDER_IMAGE):
+            buffer = io.BytesIO()
+            Image.new("RGB", (600, 400), "#e0c9a6").save(buffer, "PNG")
+            default_storage.save(
+                PLACEHOLDER_IMAGE, ContentFile(buffer.getvalue())
+            )
+        return PLACEHOLDER_IMAGE
+
+    def build_recipe(self, rng, author_id, pub_date):
+        tag_ids = self.tag_sampler.sample_unique(rng.randint(1, 3))
+        ingredient_ids = self.ingredient_sampler.sample_unique(
+            rng.randint(3, 12)
+        )
+        recipe = Recipe(
+            author_id=author_id,
+            name=f"{rng.choice(ADJECTIVES)} {rng.choice(DISHES)}",
+            text=" ".join(rng.choices(STEPS, k=rng.randint(3, 8))),
+            cooking_time=rng.randint(5, 180),
+            image=self.image,
+            pub_date=pub_date,
+        )
+        for tag_id in tag_ids:
+            recipe.tags_mask |= Tag.get_mask(self.tag_bits[tag_id])
+        ingredients = [
+            RecipeIngredient(ingredient_id=pk, amount=rng.choice(AMOUNTS))
+            for pk in ingredient_ids
+        ]
+        return recipe, tag_ids, ingredients
+
+    def create_recipes(self, author_ids, favorites_count, in_carts_count):
+        rng = random.Random(f"{self.seed}:recipes")
+        self.tag_sampler = ZipfSampler(rng, self.tags, self.exponent)
+        self.ingredient_sampler = ZipfSampler(
+            rng, self.ingredients, self.exponent
+        )
+        self.image = self.get_placeholder_image()
+        # Рецепты публикуются в среднем раз в 10 минут, последний — сейчас.
+        pub_date = timezone.now() - timezone.timedelta(
+            minutes=10 * len(author_ids)
+        )
+        recipe_ids = []
+        for batch in iter_batches(enumerate(author_ids), self.batch_size):
+            rows = []
+            for index, author_id in batch:
+                pub_date += timezone.timedelta(seconds=rng.randint(1, 1200))
+                recipe, tag_ids, ingredients = self.build_recipe(
+                    rng, author_id, pub_date
+                )
+                recipe.favorites_count = favorites_count[index]
+                recipe.in_carts_count = in_carts_count[index]
+                rows.append((recipe, tag_ids, ingredients))
+            with transaction.atomic():
+                recipe_ids += self.save_recipes(rows)
+        return recipe_ids
+
+    def save_recipes(self, rows):
+        recipes = [recipe for recipe, _, _ in rows]
+        pub_dates = [recipe.pub_date for recipe in recipes]
+        bulk_create_with_pks(Recipe, recipes)
+        # pub_date с auto_now_add перезаписывается при вставке.
+        for recipe, pub_date in zip(recipes, pub_dates):
+            recipe.pub_date = pub_date
+        Recipe.objects.bulk_update(
+            recipes, ["pub_date"], batch_size=self.batch_size
+        )
+        recipe_tags = []
+        recipe_ingredients = []
+        for recipe, tag_ids, ingredients in rows:
+            recipe_tags += [
+                Recipe.tags.through(recipe_id=recipe.pk, tag_id=tag_id)
+                for tag_id in tag_ids
+            ]
+            for ingredient in ingredients:
+                ingredient.recipe_id = recipe.pk
+            recipe_ingredients += ingredients
+        Recipe.tags.through.objects.bulk_create(recipe_tags)
+        RecipeIngredient.objects.bulk_create(
+            recipe_ingredients, batch_size=self.batch_size
+        )
+        recipe_ids = [recipe.pk for recipe in recipes]
+        bulk_update_search_index(recipe_ids)
+        return recipe_ids
+
+    def create_shopping_lists(self, user_ids):
+        """Списки покупок по корзинам созданных пользователей; bulk_create
+        не отправляет сигналы, которые ведут их при обычной работе."""
+        total = 0
+        for batch in iter_batches(user_ids, 1000):
+            items = [
+                ShoppingListItem(
+                    user_id=item["user_id"],
+                    ingredient_id=item["recipe__recipeingredient__ingredient"],
+                    amount=item["total"],
+                )
+                for item in ShoppingCart.objects.filter(
+                    user_id__in=batch,
+                    recipe__recipeingredient__isnull=False,
+                ).values(
+                    "user_id", "recipe__recipeingredient__ingredient"
+                ).annotate(
+                    total=Sum("recipe__recipeingredient__amount")
+                ).order_by()
+            ]
+            ShoppingListItem.objects.bulk_create(
+                items, batch_size=self.batch_size
+            )
+            total += len(items)
+        return total
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from api.utils.images import make_recipe_image_variants
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = "Создаёт миниатюры и WebP-версии картинок рецептов"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Пересоздать версии и для уже обработанных рецептов",
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image="")
+        if not options["all"]:
+            recipes = recipes.filter(image_thumbnail="")
+        processed = 0
+        for recipe_id, image_name in recipes.values_list(
+            "id", "image"
+        ).iterator():
+            make_recipe_image_variants(recipe_id, image_name)
+            processed += 1
+        if options["verbosity"] > 0:
+            self.stdout.write(
+                self.style.SUCCESS(f"Обработано рецептов: {processed}")
+            )
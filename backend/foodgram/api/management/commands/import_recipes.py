@@ -0,0 +1,242 @@
+import json
+import sys
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from api.management.commands.load_data import (bulk_create_with_pks,
+                                               invalidate_indexes,
+                                               iter_batches)
+from api.utils.catalog import ingredient_catalog
+from api.utils.pantry import recipe_ingredient_index
+from api.utils.search import ingredient_index
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+from recipes.search import bulk_update_search_index
+from users.models import User
+
+RECIPE_FIELDS = ("name", "text", "cooking_time", "image")
+
+
+def check_positive_int(value, name):
+    if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+        raise ValueError(f"{name} должно быть положительным целым числом")
+
+
+class Command(BaseCommand):
+    help = (
+        "Загружает рецепты из NDJSON, выгруженного командой export_recipes. "
+        "Рецепт, уже существующий у автора с тем же названием и датой "
+        "публикации, пропускается. Авторы и теги должны существовать, "
+        "недостающие ингредиенты создаются"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "input",
+            nargs="?",
+            default="-",
+            help="Путь к файлу NDJSON, по умолчанию стандартный ввод",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Количество рецептов в одной транзакции",
+        )
+
+    def handle(self, *args, **options):
+        self.verbosity = options["verbosity"]
+        self.tag_ids = dict(Tag.objects.values_list("slug", "id"))
+        self.ingredient_ids = {}
+        self.ingredients_created = False
+        stats = Counter(created=0, skipped=0, failed=0, malformed=0)
+        if options["input"] == "-":
+            self.import_file(sys.stdin, options["batch_size"], stats)
+        else:
+            with open(options["input"], "rt", encoding="utf-8") as file:
+                self.import_file(file, options["batch_size"], stats)
+        indexes = []
+        if stats["created"]:
+            indexes.append(recipe_ingredient_index)
+        if self.ingredients_created:
+            indexes += [ingredient_index, ingredient_catalog]
+        if indexes:
+            invalidate_indexes(self, *indexes)
+        if self.verbosity > 0:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Добавлено рецептов: {stats['created']}, "
+                    f"пропущено: {stats['skipped']}, "
+                    f"с ошибками: {stats['failed']}, "
+                    f"строк с неверным JSON: {stats['malformed']}"
+                )
+            )
+
+    def iter_ndjson(self, file, stats):
+        """Пары (номер строки, объект); строки с неверным JSON
+        пропускаются и учитываются в stats["malformed"]."""
+        for line_number, line in enumerate(file, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield line_number, json.loads(line)
+            except json.JSONDecodeError as error:
+                stats["malformed"] += 1
+                self.stderr.write(f"Строка {line_number}: {error}")
+
+    def import_file(self, file, batch_size, stats):
+        for batch in iter_batches(self.iter_ndjson(file, stats), batch_size):
+            self.import_batch(batch, stats)
+
+    def resolve_ingredients(self, keys):
+        """Находит id ингредиентов по (name, measurement_unit), создавая
+        недостающие; результат запоминается на всё время загрузки."""
+        keys = {
+            key for key in keys
+            if all(isinstance(value, str) for value in key)
+        } - self.ingredient_ids.keys()
+        if not keys:
+            return
+        self.find_ingredients(keys)
+        missing = keys - self.ingredient_ids.keys()
+        if missing:
+            Ingredient.objects.bulk_create(
+                [
+                    Ingredient(name=name, measurement_unit=measurement_unit)
+                    for name, measurement_unit in missing
+                ],
+                ignore_conflicts=True,
+            )
+            self.ingredients_created = True
+            self.find_ingredients(missing)
+
+    def find_ingredients(self, keys):
+        for pk, name, measurement_unit in Ingredient.objects.filter(
+            name__in={name for name, _ in keys}
+        ).values_list("id", "name", "measurement_unit"):
+            self.ingredient_ids[name, measurement_unit] = pk
+
+    def build_recipe(self, data, author_ids):
+        """Рецепт, его дата публикации, id тегов и строки ингредиентов;
+        ValueError, если данные неполны или ссылаются на неизвестные
+        объекты."""
+        missing = [
+            field for field in (*RECIPE_FIELDS, "author", "tags",
+                                "ingredients")
+            if field not in data
+        ]
+        if missing:
+            raise ValueError(f"нет полей {', '.join(missing)}")
+        if data["author"] not in author_ids:
+            raise ValueError(f"неизвестный автор {data['author']}")
+        unknown_tags = set(data["tags"]) - self.tag_ids.keys()
+        if unknown_tags:
+            raise ValueError(f"неизвестные теги {', '.join(unknown_tags)}")
+        check_positive_int(data["cooking_time"], "cooking_time")
+        for item in data["ingredients"]:
+            check_positive_int(item["amount"], "amount")
+        pub_date = data.get("pub_date")
+        pub_date = parse_datetime(pub_date) if pub_date else timezone.now()
+        if pub_date is None:
+            raise ValueError(f"неверная дата {data['pub_date']}")
+        recipe = Recipe(
+            author_id=author_ids[data["author"]],
+            image_thumbnail=data.get("image_thumbnail", ""),
+            image_webp=data.get("image_webp", ""),
+            **{field: data[field] for field in RECIPE_FIELDS},
+        )
+        ingredients = [
+            RecipeIngredient(
+                ingredient_id=self.ingredient_ids[
+                    item["name"], item["measurement_unit"]
+                ],
+                amount=item["amount"],
+            )
+            for item in data["ingredients"]
+        ]
+        tag_ids = [self.tag_ids[slug] for slug in data["tags"]]
+        # Как и API, повторы отклоняются: повтор тега нарушил бы
+        # уникальность связи и сорвал вставку всей пачки.
+        if len(set(tag_ids)) != len(tag_ids):
+            raise ValueError("теги повторяются")
+        if len({item.ingredient_id for item in ingredients}) != len(
+            ingredients
+        ):
+            raise ValueError("ингредиенты повторяются")
+        return recipe, pub_date, tag_ids, ingredients
+
+    def get_existing_keys(self, batch, author_ids):
+        return set(
+            Recipe.objects.filter(
+                author_id__in=author_ids.values(),
+                name__in={data.get("name") for _, data in batch},
+            ).values_list("author_id", "name", "pub_date")
+        )
+
+    def import_batch(self, batch, stats):
+        author_ids = dict(
+            User.objects.filter(
+                email__in={data.get("author") for _, data in batch}
+            ).values_list("email", "id")
+        )
+        self.resolve_ingredients(
+            (item.get("name"), item.get("measurement_unit"))
+            for _, data in batch for item in data.get("ingredients", ())
+        )
+        existing = self.get_existing_keys(batch, author_ids)
+        rows = []
+        for line_number, data in batch:
+            try:
+                row = self.build_recipe(data, author_ids)
+            except (KeyError, TypeError, ValueError) as error:
+                stats["failed"] += 1
+                self.stderr.write(f"Строка {line_number}: {error}")
+                continue
+            recipe, pub_date = row[:2]
+            key = (recipe.author_id, recipe.name, pub_date)
+            if key in existing:
+                stats["skipped"] += 1
+                continue
+            existing.add(key)
+            rows.append(row)
+        if rows:
+            with transaction.atomic():
+                self.save_rows(rows)
+        stats["created"] += len(rows)
+
+    def save_rows(self, rows):
+        recipes = [recipe for recipe, *_ in rows]
+        bulk_create_with_pks(Recipe, recipes)
+        recipe_tags = []
+        recipe_ingredients = []
+        for recipe, pub_date, tag_ids, ingredients in rows:
+            recipe.pub_date = pub_date
+            recipe_tags += [
+                Recipe.tags.through(recipe_id=recipe.pk, tag_id=tag_id)
+                for tag_id in tag_ids
+            ]
+            for ingredient in ingredients:
+                ingredient.recipe_id = recipe.pk
+            recipe_ingredients += ingredients
+        # pub_date с auto_now_add перезаписывается при вставке.
+        Recipe.objects.bulk_update(recipes, ["pub_date"])
+        Recipe.tags.through.objects.bulk_create(recipe_tags)
+        RecipeIngredient.objects.bulk_create(recipe_ingredients)
+        recipe_ids = [recipe.pk for recipe in recipes]
+        Recipe.objects.update_tags_masks(recipe_ids)
+        bulk_update_search_index(recipe_ids)
+        recipes_count = Counter(recipe.author_id for recipe in recipes)
+        User.objects.filter(pk__in=recipes_count).update(
+            recipes_count=F("recipes_count") + Case(
+                *(
+                    When(pk=pk, then=Value(count))
+                    for pk, count in recipes_count.items()
+                ),
+                default=Value(0),
+                output_field=IntegerField(),
+            )
+        )
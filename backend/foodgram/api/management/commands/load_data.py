@@ -1,40 +1,296 @@
+import csv
+import io
 import json
+from collections import Counter
+from itertools import islice
+from pathlib import Path
 
 from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
 
+from api.utils.catalog import ingredient_catalog, tag_catalog
+from api.utils.search import ingredient_index, is_cache_shared
+from api.utils.tags import tag_cache
 from recipes.models import Ingredient, Tag
 
+# Модель, имя файла, ключевые поля и поля исходных данных (в CSV — по
+# порядку столбцов). Служебные поля вроде Tag.bit в файлах не передаются.
 TABLES = (
-    (Ingredient, "ingredients.json"),
-    (Tag, "tags.json"),
+    (
+        Ingredient,
+        "ingredients",
+        ("name", "measurement_unit"),
+        ("name", "measurement_unit"),
+    ),
+    (Tag, "tags", ("slug", ), ("name", "color", "slug")),
 )
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def skip_separators(buffer, position):
+    while position < len(buffer) and buffer[position] in " \t\r\n,":
+        position += 1
+    return position
+
+
+def iter_json_array(file):
+    """Построчно разбирает JSON-массив объектов, не читая файл целиком."""
+    decoder = json.JSONDecoder()
+    buffer = file.read(READ_CHUNK_SIZE)
+    position = skip_separators(buffer, 0)
+    if buffer[position:position + 1] != "[":
+        raise ValueError("Ожидался JSON-массив")
+    position += 1
+    while True:
+        position = skip_separators(buffer, position)
+        if buffer[position:position + 1] == "]":
+            return
+        try:
+            obj, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            chunk = file.read(READ_CHUNK_SIZE)
+            if not chunk:
+                raise ValueError("Файл JSON оборвался")
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield obj
+
+
+def iter_csv_rows(file, field_names):
+    for row in csv.reader(file):
+        if row:
+            yield dict(zip(field_names, row))
+
+
+def iter_batches(rows, batch_size):
+    rows = iter(rows)
+    batch = list(islice(rows, batch_size))
+    while batch:
+        yield batch
+        batch = list(islice(rows, batch_size))
+
+
+def bulk_create_with_pks(model, objects):
+    """bulk_create, после которого у объектов заполнены pk.
+
+    Вызывается внутри транзакции: SQLite в Django 3.2 не возвращает id
+    из bulk_create, но запись в базу идёт под блокировкой, поэтому новые
+    строки получили последние id по порядку вставки.
+    """
+    model.objects.bulk_create(objects)
+    if objects and objects[0].pk is None:
+        pks = model.objects.order_by("-pk").values_list(
+            "pk", flat=True
+        )[:len(objects)]
+        for obj, pk in zip(objects, list(pks)[::-1]):
+            obj.pk = pk
+    return objects
+
+
+def invalidate_indexes(command, *indexes):
+    """Сбрасывает индексы и справочники в памяти процессов после
+    массового изменения данных.
+
+    Работающий сервер узнаёт о сбросе через общий кэш default; если кэш
+    локален для процесса, сервер нужно перезапустить.
+    """
+    for index in indexes:
+        index.invalidate()
+    if command.verbosity > 0 and not is_cache_shared():
+        command.stderr.write(command.style.WARNING(
+            "Кэш default хранится в памяти процесса: перезапустите "
+            "сервер, чтобы он увидел новые данные."
+        ))
+
+
+class CSVStream(io.RawIOBase):
+    """Файлоподобный объект для COPY, отдающий строки по мере чтения."""
+
+    def __init__(self, rows):
+        self.lines = self.iter_lines(rows)
+        self.buffer = b""
+        self.total = 0
+
+    def iter_lines(self, rows):
+        output = io.StringIO()
+        writer = csv.writer(output)
+        for row in rows:
+            writer.writerow(row)
+            self.total += 1
+            yield output.getvalue().encode()
+            output.seek(0)
+            output.truncate()
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            line = next(self.lines, None)
+            if line is None:
+                break
+            self.buffer += line
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
 
 
 class Command(BaseCommand):
-    help = "Загружает данные из файлов (data/*.json) в базу данных"
+    help = (
+        "Загружает данные из файлов (data/*.json, data/*.csv) в базу данных"
+    )
+
+    def add_arguments(self, parser):
+        for _, name, _, _ in TABLES:
+            parser.add_argument(
+                f"--{name}",
+                default=f"data/{name}.json",
+                help=f"Путь к файлу {name} в формате JSON или CSV",
+            )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Количество строк в одной пачке вставки",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Показать изменения, не записывая их в базу",
+        )
+        parser.add_argument(
+            "--copy",
+            action="store_true",
+            help="Загружать через COPY (только PostgreSQL)",
+        )
 
     def handle(self, *args, **options):
-        verbosity = options["verbosity"]
+        self.verbosity = verbosity = options["verbosity"]
+        if options["copy"] and connection.vendor != "postgresql":
+            raise CommandError("--copy доступен только для PostgreSQL")
         if verbosity > 0:
             self.stdout.write("Загрузка тестовых данных...")
-        for model, file_name in TABLES:
-            file_path = f"data/{file_name}"
+        for model, name, key_fields, fields in TABLES:
+            file_path = Path(options[name])
             try:
-                with open(file_path, "rt", encoding="utf-8") as json_file:
-                    json_data = json.load(json_file)
-                    for data in json_data:
-                        obj, created = model.objects.get_or_create(**data)
-                        if verbosity > 1:
-                            self.stdout.write(
-                                self.style.SUCCESS(
-                                    f"{obj} - создан: {'да' if created else 'нет'}"
-                                )
-                            )
-                    if verbosity > 0:
-                        self.stdout.write(
-                            self.style.SUCCESS(f"{file_name} - готово")
+                with open(file_path, "rt", encoding="utf-8") as file:
+                    rows = self.read_rows(file, file_path.suffix, fields)
+                    if options["copy"] and not options["dry_run"]:
+                        stats = self.copy_rows(model, rows, fields)
+                    else:
+                        stats = self.load_rows(
+                            model,
+                            rows,
+                            key_fields,
+                            options["batch_size"],
+                            options["dry_run"],
                         )
             except Exception as error:
                 raise CommandError(
-                    f"При загрузке файла {file_name} произошла ошибка." f"\r\n{error}"
+                    f"При загрузке файла {file_path} произошла ошибка."
+                    f"\r\n{error}"
+                )
+            if verbosity > 0:
+                self.stdout.write(
+                    self.style.SUCCESS(
+                        f"{file_path} - добавлено: {stats['created']}, "
+                        f"обновлено: {stats['updated']}, "
+                        f"пропущено: {stats['skipped']}"
+                    )
                 )
+        if not options["dry_run"]:
+            Tag.objects.allocate_bits()
+            invalidate_indexes(
+                self, ingredient_index, ingredient_catalog, tag_catalog,
+                tag_cache,
+            )
+
+    def read_rows(self, file, suffix, fields):
+        if suffix == ".csv":
+            return iter_csv_rows(file, fields)
+        return iter_json_array(file)
+
+    def diff_batch(self, model, batch, key_fields):
+        """Делит пачку строк на новые объекты, изменённые объекты и
+        число строк, уже совпадающих с базой."""
+        batch = {
+            tuple(row[field] for field in key_fields): row
+            for row in batch
+        }
+        existing = {
+            tuple(getattr(obj, field) for field in key_fields): obj
+            for obj in model.objects.filter(**{
+                f"{key_fields[0]}__in": {key[0] for key in batch}
+            })
+        }
+        to_create, to_update, update_fields = [], [], set()
+        for key, row in batch.items():
+            obj = existing.get(key)
+            if obj is None:
+                to_create.append(model(**row))
+                continue
+            changed = {
+                field: value for field, value in row.items()
+                if getattr(obj, field) != value
+            }
+            for field, value in changed.items():
+                setattr(obj, field, value)
+            if changed:
+                update_fields.update(changed)
+                to_update.append(obj)
+        skipped = len(batch) - len(to_create) - len(to_update)
+        return to_create, to_update, update_fields, skipped
+
+    def load_rows(self, model, rows, key_fields, batch_size, dry_run):
+        stats = Counter(created=0, updated=0, skipped=0)
+        show_diff = self.verbosity > 1 or (dry_run and self.verbosity > 0)
+        for batch in iter_batches(rows, batch_size):
+            to_create, to_update, update_fields, skipped = self.diff_batch(
+                model, batch, key_fields
+            )
+            stats["created"] += len(to_create)
+            stats["updated"] += len(to_update)
+            stats["skipped"] += skipped
+            if show_diff:
+                for obj in to_create:
+                    self.stdout.write(f"+ {obj}")
+                for obj in to_update:
+                    self.stdout.write(f"~ {obj}")
+            if dry_run:
+                continue
+            with transaction.atomic():
+                model.objects.bulk_create(to_create, ignore_conflicts=True)
+                if to_update:
+                    model.objects.bulk_update(to_update, update_fields)
+        return stats
+
+    def copy_rows(self, model, rows, fields):
+        """Загрузка через COPY во временную таблицу и INSERT ... ON
+        CONFLICT DO NOTHING; существующие строки не обновляются."""
+        table = connection.ops.quote_name(model._meta.db_table)
+        column_list = ", ".join(
+            connection.ops.quote_name(model._meta.get_field(field).column)
+            for field in fields
+        )
+        stream = CSVStream([row[field] for field in fields] for row in rows)
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE TEMP TABLE load_data_rows ON COMMIT DROP AS "
+                f"SELECT {column_list} FROM {table} WITH NO DATA"
+            )
+            cursor.copy_expert(
+                f"COPY load_data_rows ({column_list}) FROM STDIN "
+                f"WITH (FORMAT csv)",
+                stream,
+            )
+            cursor.execute(
+                f"INSERT INTO {table} ({column_list}) "
+                f"SELECT DISTINCT {column_list} FROM load_data_rows "
+                f"ON CONFLICT DO NOTHING"
+            )
+            created = cursor.rowcount
+        return Counter(
+            created=created, updated=0, skipped=stream.total - created
+        )
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from recipes.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = "Перестраивает полнотекстовый индекс рецептов"
+
+    def handle(self, *args, **options):
+        rebuild_search_index()
+        if options["verbosity"] > 0:
+            self.stdout.write(self.style.SUCCESS("Индекс перестроен"))
@@ -0,0 +1,82 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Sum
+
+from recipes.models import ShoppingCart, ShoppingListItem
+
+
+class Command(BaseCommand):
+    help = (
+        "Сверяет материализованные списки покупок с корзинами "
+        "и перестраивает их"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Только проверить расхождения, не изменяя данные",
+        )
+
+    def handle(self, *args, **options):
+        verbosity = options["verbosity"]
+        expected = {
+            (item["user_id"], item["recipe__recipeingredient__ingredient"]):
+                item["total"]
+            for item in ShoppingCart.objects.filter(
+                recipe__recipeingredient__isnull=False
+            ).values(
+                "user_id", "recipe__recipeingredient__ingredient"
+            ).annotate(
+                total=Sum("recipe__recipeingredient__amount")
+            ).order_by()
+        }
+        actual = {
+            (user_id, ingredient_id): amount
+            for user_id, ingredient_id, amount
+            in ShoppingListItem.objects.values_list(
+                "user_id", "ingredient_id", "amount"
+            )
+        }
+        mismatches = {
+            key for key in {*expected, *actual}
+            if expected.get(key) != actual.get(key)
+        }
+        if verbosity > 1:
+            for user_id, ingredient_id in sorted(mismatches):
+                self.stdout.write(
+                    f"user={user_id} ingredient={ingredient_id}: "
+                    f"ожидалось {expected.get((user_id, ingredient_id))}, "
+                    f"в таблице {actual.get((user_id, ingredient_id))}"
+                )
+        if options["check"]:
+            if mismatches:
+                raise CommandError(
+                    f"Найдено расхождений: {len(mismatches)}"
+                )
+            if verbosity > 0:
+                self.stdout.write(self.style.SUCCESS("Расхождений нет"))
+            return
+        with transaction.atomic():
+            ShoppingListItem.objects.all().delete()
+            ShoppingListItem.objects.bulk_create(
+                (
+                    ShoppingListItem(
+                        user_id=user_id,
+                        ingredient_id=ingredient_id,
+                        amount=amount,
+                    )
+                    for (user_id, ingredient_id), amount in expected.items()
+                ),
+                batch_size=1000,
+            )
+            ShoppingListItem.objects.bump_versions(
+                {user_id for user_id, _ in mismatches}
+            )
+        if verbosity > 0:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Списки покупок перестроены, "
+                    f"исправлено расхождений: {len(mismatches)}"
+                )
+            )
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from api.utils.tags import tag_cache
+from recipes.models import Recipe, Tag
+
+
+class Command(BaseCommand):
+    help = (
+        "Выдаёт биты тегам без бита и пересчитывает битовые маски тегов "
+        "у всех рецептов"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Количество рецептов в одной пачке",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        if Tag.objects.allocate_bits():
+            tag_cache.invalidate()
+        recipe_ids = list(
+            Recipe.objects.order_by("id").values_list("id", flat=True)
+        )
+        for start in range(0, len(recipe_ids), batch_size):
+            Recipe.objects.update_tags_masks(
+                recipe_ids[start:start + batch_size]
+            )
+        if options["verbosity"] > 0:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Маски тегов пересчитаны: {len(recipe_ids)}"
+                )
+            )
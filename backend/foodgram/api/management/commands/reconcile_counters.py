@@ -0,0 +1,80 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import Follow, User
+
+COUNTERS = (
+    (Recipe, "favorites_count", Favorite, "recipe"),
+    (Recipe, "in_carts_count", ShoppingCart, "recipe"),
+    (User, "followers_count", Follow, "author"),
+    (User, "recipes_count", Recipe, "author"),
+)
+BATCH_SIZE = 1000
+
+
+def count_related(related_model, field):
+    return Coalesce(
+        Subquery(
+            related_model.objects.filter(
+                **{field: OuterRef("pk")}
+            ).order_by().values(field).annotate(
+                total=Count("pk")
+            ).values("total"),
+            output_field=IntegerField(),
+        ),
+        0,
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Сверяет счётчики избранного, корзин, подписчиков и рецептов "
+        "с данными и исправляет расхождения"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Только проверить расхождения, не изменяя данные",
+        )
+
+    def handle(self, *args, **options):
+        verbosity = options["verbosity"]
+        total = 0
+        for model, counter, related_model, field in COUNTERS:
+            actual = count_related(related_model, field)
+            with transaction.atomic():
+                mismatches = list(
+                    model.objects.annotate(actual=actual).exclude(
+                        **{counter: F("actual")}
+                    ).values_list("pk", counter, "actual")
+                )
+                if not options["check"]:
+                    pks = [pk for pk, _, _ in mismatches]
+                    for start in range(0, len(pks), BATCH_SIZE):
+                        model.objects.filter(
+                            pk__in=pks[start:start + BATCH_SIZE]
+                        ).update(**{counter: actual})
+            total += len(mismatches)
+            if verbosity > 1:
+                for pk, stored, expected in mismatches:
+                    self.stdout.write(
+                        f"{model._meta.model_name}={pk} {counter}: "
+                        f"ожидалось {expected}, в таблице {stored}"
+                    )
+        if options["check"]:
+            if total:
+                raise CommandError(f"Найдено расхождений: {total}")
+            if verbosity > 0:
+                self.stdout.write(self.style.SUCCESS("Расхождений нет"))
+            return
+        if verbosity > 0:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Счётчики пересчитаны, исправлено расхождений: {total}"
+                )
+            )
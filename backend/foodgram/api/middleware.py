@@ -0,0 +1,85 @@
+from contextlib import ExitStack
+from time import perf_counter
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from api.utils.metrics import observe_request
+from api.utils.timing import RequestMetrics, current_metrics, view_stats
+
+
+class ServerTimingMiddleware:
+    """Заголовок Server-Timing и статистика по представлениям.
+
+    Включается настройкой SERVER_TIMING_ENABLED; собранные данные
+    доступны администраторам по /api/performance/.
+    """
+
+    def __init__(self, get_response):
+        if not settings.SERVER_TIMING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(metrics.record_query)
+                    )
+                response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        metrics.finish_view()
+        total_time = metrics.total_time
+        response['Server-Timing'] = metrics.server_timing(total_time)
+        if request.resolver_match is not None:
+            view_stats.add(
+                request.resolver_match.view_name, metrics, total_time
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        metrics = current_metrics.get()
+        if metrics is not None:
+            metrics.start_view()
+
+    def process_template_response(self, request, response):
+        metrics = current_metrics.get()
+        if metrics is not None:
+            metrics.finish_view()
+            metrics.start_render()
+            response.add_post_render_callback(metrics.finish_render)
+        return response
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class PrometheusMetricsMiddleware:
+    """Время ответа и число запросов к базе по действиям DRF для
+    /metrics; включается настройкой METRICS_ENABLED."""
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = perf_counter()
+        queries = QueryCounter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(queries))
+            response = self.get_response(request)
+        observe_request(request, started, queries.count)
+        return response
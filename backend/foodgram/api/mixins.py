@@ -1,17 +1,29 @@
 from typing import Type, Union
 
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction
 from django.shortcuts import get_object_or_404
 from rest_framework import status
 from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet
 
-from recipes.models import Favorite, ShoppingCart
+from api.serializers import RecipeIdListSerializer
+from api.utils.cart import SessionCart
+from api.utils.metrics import count_writes
+from recipes.models import Favorite, Recipe, ShoppingCart
 from users.models import Follow
 
 
 class CreateAndDeleteMixin:
+    def get_related_manager(
+            self: ModelViewSet,
+            klass: Union[Type[Favorite], Type[ShoppingCart]],
+    ):
+        """Список покупок анонимного пользователя хранится в сессии."""
+        if klass is ShoppingCart and self.request.user.is_anonymous:
+            return SessionCart(self.request.session)
+        return klass.objects
+
     def create_and_delete_related(
             self: ModelViewSet,
             pk: int,
@@ -25,11 +37,19 @@ class CreateAndDeleteMixin:
             'user': self.request.user,
             field_to_create_or_delete_name: self_qs_obj
         }
+        anonymous = self.request.user.is_anonymous
         if self.request.method == 'POST':
-            try:
-                klass.objects.create(**kwargs)
-            except IntegrityError:
-                raise ValidationError({'errors': created_failed_message})
+            if anonymous:
+                if not self.get_related_manager(klass).add_for_user(
+                    None, [self_qs_obj.pk]
+                ):
+                    raise ValidationError({'errors': created_failed_message})
+            else:
+                try:
+                    with transaction.atomic():
+                        klass.objects.create(**kwargs)
+                except IntegrityError:
+                    raise ValidationError({'errors': created_failed_message})
 
             context = self.get_serializer_context()
             serializer = self.get_serializer_class()
@@ -38,14 +58,76 @@ class CreateAndDeleteMixin:
                 status=status.HTTP_201_CREATED,
             )
         elif self.request.method == 'DELETE':
-            klass_obj = klass.objects.filter(**kwargs).first()
+            if anonymous:
+                if not self.get_related_manager(klass).remove_for_user(
+                    None, [self_qs_obj.pk]
+                ):
+                    raise ValidationError({'errors': delete_failed_message})
+            else:
+                klass_obj = klass.objects.filter(**kwargs).first()
 
-            if klass_obj is None:
-                raise ValidationError({'errors': delete_failed_message})
-            klass_obj.delete()
+                if klass_obj is None:
+                    raise ValidationError({'errors': delete_failed_message})
+                klass_obj.delete()
 
             response = Response(status=status.HTTP_204_NO_CONTENT)
         else:
             raise ValidationError({'errors': 'Неверный метод запроса'})
 
         return response
+
+    def create_and_delete_related_batch(
+            self: ModelViewSet,
+            klass: Union[Type[Favorite], Type[ShoppingCart]],
+    ):
+        """Добавляет (POST) или удаляет (DELETE) сразу несколько
+        рецептов, переданных списком id в поле recipes.
+
+        В ответе для каждого id указан результат: added, exists,
+        removed, absent или not_found; при добавлении также
+        возвращаются найденные рецепты.
+        """
+        input_serializer = RecipeIdListSerializer(data=self.request.data)
+        input_serializer.is_valid(raise_exception=True)
+        recipe_ids = list(dict.fromkeys(
+            input_serializer.validated_data['recipes']
+        ))
+        recipes = Recipe.objects.in_bulk(recipe_ids)
+        found_ids = [pk for pk in recipe_ids if pk in recipes]
+        user_id = self.request.user.id
+        manager = self.get_related_manager(klass)
+        if self.request.method == 'POST':
+            with transaction.atomic():
+                changed = manager.add_for_user(user_id, found_ids)
+            changed_status, unchanged_status = 'added', 'exists'
+        elif self.request.method == 'DELETE':
+            with transaction.atomic():
+                changed = manager.remove_for_user(user_id, found_ids)
+            changed_status, unchanged_status = 'removed', 'absent'
+        else:
+            raise ValidationError({'errors': 'Неверный метод запроса'})
+        if manager is klass.objects:
+            count_writes(
+                klass._meta.model_name,
+                'add' if self.request.method == 'POST' else 'remove',
+                len(changed),
+            )
+        changed = set(changed)
+        results = []
+        for pk in recipe_ids:
+            if pk not in recipes:
+                result_status = 'not_found'
+            elif pk in changed:
+                result_status = changed_status
+            else:
+                result_status = unchanged_status
+            results.append({'id': pk, 'status': result_status})
+        data = {'results': results}
+        if self.request.method == 'POST':
+            serializer = self.get_serializer_class()
+            data['recipes'] = serializer(
+                [recipes[pk] for pk in found_ids],
+                many=True,
+                context=self.get_serializer_context(),
+            ).data
+        return Response(data, status=status.HTTP_200_OK)
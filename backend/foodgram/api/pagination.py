@@ -1,5 +1,114 @@
+from base64 import b64decode, b64encode
+from collections import OrderedDict
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
 from rest_framework import pagination
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 
 class PageNumberLimitPagination(pagination.PageNumberPagination):
     page_size_query_param = 'limit'
+
+
+class RecipeCursorPagination(pagination.BasePagination):
+    """Постраничный вывод рецептов по ключу (pub_date, id).
+
+    Следующая страница выбирается условием на последний показанный
+    рецепт, без OFFSET и COUNT(*), поэтому её стоимость не зависит
+    от глубины прокрутки.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'limit'
+    ordering_query_param = 'ordering'
+    invalid_cursor_message = 'Неверный курсор.'
+    invalid_ordering_message = (
+        'Постраничный вывод по курсору поддерживает только сортировку '
+        'по дате публикации.'
+    )
+
+    def get_page_size(self, request):
+        try:
+            return pagination._positive_int(
+                request.query_params[self.page_size_query_param],
+                strict=True,
+            )
+        except (KeyError, ValueError):
+            return pagination.api_settings.PAGE_SIZE
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            pub_date, pk = b64decode(
+                encoded.encode('ascii'), altchars=b'-_'
+            ).decode('ascii').rsplit('|', 1)
+            pub_date, pk = parse_datetime(pub_date), int(pk)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if pub_date is None:
+            raise NotFound(self.invalid_cursor_message)
+        return pub_date, pk
+
+    def encode_cursor(self, recipe):
+        cursor = f'{recipe.pub_date.isoformat()}|{recipe.pk}'
+        return b64encode(cursor.encode('ascii'), altchars=b'-_').decode()
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if request.query_params.get(self.ordering_query_param):
+            raise ValidationError(
+                {self.ordering_query_param: self.invalid_ordering_message}
+            )
+        page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        queryset = queryset.order_by('-pub_date', '-id')
+        position = self.decode_cursor(request)
+        if position is not None:
+            pub_date, pk = position
+            queryset = queryset.filter(
+                Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, id__lt=pk)
+            )
+        results = list(queryset[:page_size + 1])
+        self.next_recipe = (
+            results[page_size - 1] if len(results) > page_size else None
+        )
+        return results[:page_size]
+
+    def get_next_link(self):
+        if self.next_recipe is None:
+            return None
+        return replace_query_param(
+            self.base_url,
+            self.cursor_query_param,
+            self.encode_cursor(self.next_recipe),
+        )
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+
+class RecipePagination(PageNumberLimitPagination):
+    """Постраничный вывод по номеру страницы или, если в запросе есть
+    параметр cursor (в том числе пустой), по ключу."""
+    cursor_pagination_class = RecipeCursorPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_pagination = None
+        cursor_pagination = self.cursor_pagination_class()
+        if cursor_pagination.cursor_query_param in request.query_params:
+            self.cursor_pagination = cursor_pagination
+            return cursor_pagination.paginate_queryset(
+                queryset, request, view
+            )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_pagination is not None:
+            return self.cursor_pagination.get_paginated_response(data)
+        return super().get_paginated_response(data)
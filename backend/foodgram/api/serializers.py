@@ -1,15 +1,22 @@
+from collections import Counter
+
 from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.db import transaction
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
+from rest_framework.relations import MANY_RELATION_KWARGS, ManyRelatedField
 
+from api.utils.images import schedule_recipe_image_variants
+from api.utils.metrics import IMAGE_DECODE_BYTES
 from recipes.models import (
     Favorite,
     Ingredient,
     Recipe,
     RecipeIngredient,
     ShoppingCart,
+    ShoppingListItem,
     Tag
 )
 from users.models import Follow, User
@@ -19,11 +26,24 @@ class CustomUserSerializer(UserSerializer):
     is_subscribed = serializers.SerializerMethodField()
 
     def get_is_subscribed(self, author):
-        request = self.context['request']
-        return (
-                request.user.is_authenticated
-                and author.following.filter(user=request.user).exists()
-        )
+        if hasattr(author, 'is_subscribed'):
+            return author.is_subscribed
+        return author.id in self.get_subscriptions()
+
+    def get_subscriptions(self):
+        """Id авторов, на которых подписан текущий пользователь.
+
+        Загружаются один раз и хранятся в контексте, общем для всех
+        вложенных сериализаторов ответа.
+        """
+        request = self.context.get('request')
+        if request is None or not request.user.is_authenticated:
+            return frozenset()
+        if 'subscriptions' not in self.context:
+            self.context['subscriptions'] = frozenset(
+                request.user.followers.values_list('author_id', flat=True)
+            )
+        return self.context['subscriptions']
 
     class Meta:
         model = User
@@ -74,17 +94,106 @@ class FollowSerializer(serializers.ModelSerializer):
         return data
 
 
+class RecipeImageField(Base64ImageField):
+    """Картинка рецепта в виде обработанной версии variant.
+
+    Пока версия не готова, отдаётся исходная картинка.
+    """
+
+    def __init__(self, variant, **kwargs):
+        self.variant = variant
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def get_attribute(self, instance):
+        return (
+            getattr(instance, self.variant)
+            or super().get_attribute(instance)
+        )
+
+
+class RecipeImageUploadField(Base64ImageField):
+    """Base64ImageField, учитывающий размер декодированной картинки."""
+
+    def to_internal_value(self, base64_data):
+        image = super().to_internal_value(base64_data)
+        if image is not None:
+            IMAGE_DECODE_BYTES.observe(image.size)
+        return image
+
+
+class BulkManyRelatedField(ManyRelatedField):
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            self.child_relation.prefetch(data)
+        return super().to_internal_value(data)
+
+
+class BulkPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """Первичный ключ, который ищется среди объектов, загруженных
+    заранее одним запросом.
+
+    Списочное поле (many=True или list_serializer_class вложенного
+    сериализатора) вызывает prefetch со всеми переданными значениями;
+    ошибки по отдельным элементам остаются прежними.
+    """
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return BulkManyRelatedField(**list_kwargs)
+
+    def to_pk(self, data):
+        if isinstance(data, bool):
+            raise TypeError
+        return self.get_queryset().model._meta.pk.to_python(data)
+
+    def prefetch(self, values):
+        pks = set()
+        for value in values:
+            try:
+                pks.add(self.to_pk(value))
+            except (TypeError, DjangoValidationError):
+                continue
+        self.objects = self.get_queryset().in_bulk(pks)
+
+    def to_internal_value(self, data):
+        objects = getattr(self, 'objects', None)
+        if objects is None:
+            return super().to_internal_value(data)
+        try:
+            pk = self.to_pk(data)
+        except (TypeError, DjangoValidationError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if pk not in objects:
+            self.fail('does_not_exist', pk_value=data)
+        return objects[pk]
+
+
 class RecipeMinifiedSerializer(serializers.ModelSerializer):
-    image = Base64ImageField(max_length=None, use_url=True)
+    image = RecipeImageField(
+        variant='image_thumbnail', max_length=None, use_url=True
+    )
 
     class Meta:
         model = Recipe
         fields = ('name', 'image', 'cooking_time', 'id')
 
 
+class RecipeIdListSerializer(serializers.Serializer):
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.RECIPE_BATCH_MAX_SIZE,
+    )
+
+
 class UserExtendedSerializer(CustomUserSerializer):
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
+    recipes_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = User
@@ -101,17 +210,17 @@ class UserExtendedSerializer(CustomUserSerializer):
         read_only_fields = fields
 
     def get_recipes(self, obj):
-        recipes_limit = self.context.get(
-            'recipes_limit',
-            settings.DEFAULT_RECIPES_LIMIT)
-        recipes = obj.recipes.all()[:recipes_limit]
+        if hasattr(obj, 'latest_recipes'):
+            recipes = obj.latest_recipes
+        else:
+            recipes_limit = self.context.get(
+                'recipes_limit',
+                settings.DEFAULT_RECIPES_LIMIT)
+            recipes = obj.recipes.all()[:recipes_limit]
         return RecipeMinifiedSerializer(
             recipes, many=True, context=self.context
         ).data
 
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
-
 
 class TagSerializer(serializers.ModelSerializer):
     class Meta:
@@ -146,9 +255,21 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
         )
 
 
+class IngredientCreateInRecipeListSerializer(serializers.ListSerializer):
+    """Загружает все ингредиенты списка одним запросом перед
+    проверкой отдельных элементов."""
+
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            self.child.fields['id'].prefetch(
+                item.get('id') for item in data if isinstance(item, dict)
+            )
+        return super().to_internal_value(data)
+
+
 class IngredientCreateInRecipeSerializer(serializers.ModelSerializer):
     recipe = serializers.PrimaryKeyRelatedField(read_only=True)
-    id = serializers.PrimaryKeyRelatedField(
+    id = BulkPrimaryKeyRelatedField(
         source='ingredient',
         queryset=Ingredient.objects.all()
     )
@@ -157,6 +278,7 @@ class IngredientCreateInRecipeSerializer(serializers.ModelSerializer):
     class Meta:
         model = RecipeIngredient
         fields = ('id', 'recipe', 'amount')
+        list_serializer_class = IngredientCreateInRecipeListSerializer
 
 
 class TagsCreateInRecipeSerializer(serializers.ModelSerializer):
@@ -168,7 +290,9 @@ class TagsCreateInRecipeSerializer(serializers.ModelSerializer):
 class RecipeListSerializer(serializers.ModelSerializer):
     tags = TagSerializer(many=True)
     author = CustomUserSerializer()
-    image = Base64ImageField(max_length=None, use_url=True)
+    image = RecipeImageField(
+        variant='image_thumbnail', max_length=None, use_url=True
+    )
     ingredients = serializers.SerializerMethodField()
     is_favorited = serializers.SerializerMethodField(
         method_name='get_is_favorited')
@@ -177,14 +301,27 @@ class RecipeListSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Recipe
-        exclude = ('pub_date', )
+        fields = (
+            'id',
+            'tags',
+            'author',
+            'ingredients',
+            'is_favorited',
+            'is_in_shopping_cart',
+            'name',
+            'image',
+            'text',
+            'cooking_time',
+        )
 
     def get_ingredients(self, obj):
         return RecipeIngredientSerializer(
-            RecipeIngredient.objects.filter(recipe=obj).all(), many=True
+            obj.recipeingredient_set.all(), many=True
         ).data
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         request = self.context.get('request')
         if request is None or request.user.is_anonymous:
             return False
@@ -193,6 +330,8 @@ class RecipeListSerializer(serializers.ModelSerializer):
         ).exists()
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         request = self.context.get('request')
         if request is None or request.user.is_anonymous:
             return False
@@ -201,33 +340,62 @@ class RecipeListSerializer(serializers.ModelSerializer):
         ).exists()
 
 
+class RecipeDetailSerializer(RecipeListSerializer):
+    image = RecipeImageField(
+        variant='image_webp', max_length=None, use_url=True
+    )
+
+
 class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
     ingredients = IngredientCreateInRecipeSerializer(many=True)
-    tags = serializers.PrimaryKeyRelatedField(
+    tags = BulkPrimaryKeyRelatedField(
         many=True,
         queryset=Tag.objects.all()
     )
-    image = Base64ImageField()
+    image = RecipeImageUploadField()
     author = CustomUserSerializer(required=False)
 
     class Meta:
         model = Recipe
-        exclude = ('pub_date', )
+        fields = (
+            'id',
+            'tags',
+            'author',
+            'ingredients',
+            'name',
+            'image',
+            'text',
+            'cooking_time',
+        )
 
     def validate(self, attrs):
-        if len(attrs['tags']) == 0:
+        if 'tags' in attrs:
+            self.validate_tag_list(attrs['tags'])
+        if 'ingredients' in attrs:
+            self.validate_ingredient_list(attrs['ingredients'])
+        if attrs.get('cooking_time', 1) <= 0:
+            raise serializers.ValidationError(
+                'Время приготовления должно быть больше нуля.'
+            )
+        return super().validate(attrs)
+
+    @staticmethod
+    def validate_tag_list(tags):
+        if len(tags) == 0:
             raise serializers.ValidationError(
                 'Должен быть выбран хотя бы один тег.'
             )
-        if len(attrs['tags']) != len(set(attrs['tags'])):
+        if len(tags) != len(set(tags)):
             raise serializers.ValidationError(
                 'Теги должны быть уникальны.'
             )
-        if len(attrs['ingredients']) == 0:
+
+    @staticmethod
+    def validate_ingredient_list(ingredients):
+        if len(ingredients) == 0:
             raise serializers.ValidationError(
                 'Должен быть выбран хотя бы один ингредиент.'
             )
-        ingredients = attrs['ingredients']
         if len(ingredients) != len(
                 set(obj['ingredient'] for obj in ingredients)
         ):
@@ -238,11 +406,6 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(
                 'Количество ингредиента должно быть больше нуля.'
             )
-        if attrs['cooking_time'] <= 0:
-            raise serializers.ValidationError(
-                'Время приготовления должно быть больше нуля.'
-            )
-        return super().validate(attrs)
 
     @transaction.atomic
     def create(self, validated_data):
@@ -259,33 +422,92 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
             for ingredient in ingredients
         ]
         RecipeIngredient.objects.bulk_create(create_ingredients)
+        schedule_recipe_image_variants(recipe)
+        recipe.saved_tags = tags
+        recipe.saved_ingredients = create_ingredients
         return recipe
 
+    @staticmethod
+    def diff_ingredients(instance, ingredients):
+        """Сравнивает строки рецепта с ingredients.
+
+        Возвращает прежние количества ({id ингредиента: количество}),
+        строки в порядке ingredients, а также новые строки, строки с
+        изменённым количеством и id лишних строк.
+        """
+        existing = {}
+        old_amounts = Counter()
+        to_delete = []
+        for row in RecipeIngredient.objects.filter(recipe=instance):
+            old_amounts[row.ingredient_id] += row.amount
+            if row.ingredient_id in existing:
+                to_delete.append(row.pk)
+            else:
+                existing[row.ingredient_id] = row
+        rows, to_create, to_update = [], [], []
+        for ingredient in ingredients:
+            row = existing.pop(ingredient['ingredient'].id, None)
+            if row is None:
+                row = RecipeIngredient(recipe=instance)
+                to_create.append(row)
+            elif row.amount != ingredient['amount']:
+                to_update.append(row)
+            row.ingredient = ingredient['ingredient']
+            row.amount = ingredient['amount']
+            rows.append(row)
+        to_delete += [row.pk for row in existing.values()]
+        return dict(old_amounts), rows, to_create, to_update, to_delete
+
+    def update_ingredients(self, instance, ingredients):
+        """Приводит ингредиенты рецепта к ingredients, меняя только
+        отличающиеся строки."""
+        (
+            old_amounts, rows, to_create, to_update, to_delete
+        ) = self.diff_ingredients(instance, ingredients)
+        if to_delete:
+            RecipeIngredient.objects.filter(pk__in=to_delete).delete()
+        if to_update:
+            RecipeIngredient.objects.bulk_update(to_update, ['amount'])
+        if to_create:
+            RecipeIngredient.objects.bulk_create(to_create)
+        new_amounts = {row.ingredient_id: row.amount for row in rows}
+        if new_amounts != old_amounts:
+            ShoppingListItem.objects.change_recipe(
+                instance, old_amounts, new_amounts
+            )
+        return rows
+
     @transaction.atomic
     def update(self, instance, validated_data):
         ingredients = validated_data.pop('ingredients', None)
         tags = validated_data.pop('tags', None)
         if tags is not None:
             instance.tags.set(tags)
+            instance.saved_tags = tags
         if ingredients is not None:
-            instance.ingredients.clear()
-
-            create_ingredients = [
-                RecipeIngredient(
-                    recipe=instance,
-                    ingredient=ingredient['ingredient'],
-                    amount=ingredient['amount']
-                )
-                for ingredient in ingredients
-            ]
-            RecipeIngredient.objects.bulk_create(create_ingredients)
-        return super().update(instance, validated_data)
+            instance.saved_ingredients = self.update_ingredients(
+                instance, ingredients
+            )
+        image_changed = 'image' in validated_data
+        if image_changed:
+            validated_data.update(image_thumbnail='', image_webp='')
+        instance = super().update(instance, validated_data)
+        if image_changed:
+            instance.save(update_fields=('image_thumbnail', 'image_webp'))
+            schedule_recipe_image_variants(instance)
+        return instance
 
     def to_representation(self, obj):
-        self.fields.pop('ingredients')
-        self.fields['tags'] = TagSerializer(many=True)
-        representation = super().to_representation(obj)
-        representation['ingredients'] = RecipeIngredientSerializer(
-            RecipeIngredient.objects.filter(recipe=obj).all(), many=True
-        ).data
-        return representation
+        """Теги и ингредиенты берутся из только что сохранённых данных
+        (saved_tags, saved_ingredients), без повторных запросов."""
+        if not hasattr(obj, 'saved_tags'):
+            obj.saved_tags = obj.tags.all()
+        if not hasattr(obj, 'saved_ingredients'):
+            obj.saved_ingredients = obj.recipeingredient_set.select_related(
+                'ingredient'
+            )
+        self.fields['tags'] = TagSerializer(many=True, source='saved_tags')
+        self.fields['ingredients'] = RecipeIngredientSerializer(
+            many=True, source='saved_ingredients'
+        )
+        return super().to_representation(obj)
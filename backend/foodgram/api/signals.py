@@ -0,0 +1,100 @@
+from django.contrib.auth.signals import user_logged_in
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from api.authentication import invalidate_tokens
+from api.utils.cart import SessionCart
+from api.utils.catalog import ingredient_catalog, tag_catalog
+from api.utils.metrics import count_writes
+from api.utils.pantry import recipe_ingredient_index
+from api.utils.search import ingredient_index
+from api.utils.tags import tag_cache
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, Tag)
+from users.models import Follow, User
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_ingredient_index(sender, **kwargs):
+    ingredient_index.invalidate()
+    ingredient_catalog.invalidate()
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_tag_catalog(sender, **kwargs):
+    tag_catalog.invalidate()
+    tag_cache.invalidate()
+
+
+@receiver(post_save, sender=Recipe)
+def update_recipe_ingredient_index(sender, instance, update_fields, **kwargs):
+    """Сериализатор меняет ингредиенты массовыми запросами без сигналов,
+    но всегда сохраняет сам рецепт; сохранение одних денормализованных
+    полей (варианты изображения) состав не меняет."""
+    if update_fields is None or not set(update_fields) <= set(
+        sender.denormalized_fields
+    ):
+        recipe_ingredient_index.update_recipe(instance.pk)
+
+
+@receiver(post_delete, sender=Recipe)
+def remove_from_recipe_ingredient_index(sender, instance, **kwargs):
+    recipe_ingredient_index.remove_recipe(instance.pk)
+
+
+@receiver(pre_save, sender=RecipeIngredient)
+def remember_ingredient_recipe(sender, instance, **kwargs):
+    if not instance._state.adding:
+        instance._old_recipe_id = RecipeIngredient.objects.filter(
+            pk=instance.pk
+        ).values_list('recipe_id', flat=True).first()
+
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def update_ingredient_recipe_index(sender, instance, **kwargs):
+    """Правки отдельных строк, например в админке."""
+    old_recipe_id = instance.__dict__.pop('_old_recipe_id', None)
+    for recipe_id in {instance.recipe_id, old_recipe_id} - {None}:
+        recipe_ingredient_index.update_recipe(recipe_id)
+
+
+@receiver(user_logged_in)
+def merge_session_cart(sender, request, user, **kwargs):
+    """Список покупок, собранный до входа, переносится к пользователю."""
+    session = getattr(request, 'session', None)
+    if session is not None:
+        SessionCart(session).merge_into(user.pk)
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    invalidate_tokens([instance.key])
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_tokens(sender, instance, created, **kwargs):
+    """Смена пароля, блокировка и другие изменения пользователя
+    сбрасывают закэшированный токен."""
+    if not created:
+        invalidate_tokens(
+            Token.objects.filter(user=instance).values_list('key', flat=True)
+        )
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_save, sender=Follow)
+def count_relation_added(sender, created, **kwargs):
+    if created:
+        count_writes(sender._meta.model_name, 'add')
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(post_delete, sender=Follow)
+def count_relation_removed(sender, **kwargs):
+    count_writes(sender._meta.model_name, 'remove')
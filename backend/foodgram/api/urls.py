@@ -2,8 +2,8 @@ from django.urls import include, path
 from djoser.views import TokenCreateView, TokenDestroyView, UserViewSet
 from rest_framework.routers import DefaultRouter
 
-from api.views import (CustomUserViewSet, IngredientViewSet, RecipeViewSet,
-                       TagsViewSet)
+from api.views import (CustomUserViewSet, IngredientViewSet,
+                       PerformanceStatsView, RecipeViewSet, TagsViewSet)
 
 app_name = 'api'
 
@@ -35,7 +35,7 @@ users_patterns = [
          ),
     path(
         'set_password/',
-        CustomUserViewSet.as_view({'post': 'set_password'}),
+        UserViewSet.as_view({'post': 'set_password'}),
         name='set-password',
         ),
     path(
@@ -58,5 +58,9 @@ users_patterns = [
 urlpatterns = [
     path('auth/', include(auth_patterns)),
     path('users/', include(users_patterns)),
+    path('performance/',
+         PerformanceStatsView.as_view(),
+         name='performance'
+         ),
     path('', include(router.urls)),
 ]
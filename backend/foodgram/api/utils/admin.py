@@ -0,0 +1,112 @@
+from django import forms
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.admin.views.main import PAGE_VAR
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+
+class AutocompleteFilter(admin.FieldListFilter):
+    """Фильтр списка по внешнему ключу с полем автодополнения.
+
+    В отличие от RelatedFieldListFilter не выводит все связанные
+    объекты в боковой панели: варианты подгружаются через
+    autocomplete-представление админки, а для выбранного значения
+    выполняется один запрос. У админки связанной модели должны быть
+    заданы search_fields.
+    """
+    template = 'admin/autocomplete_filter.html'
+
+    def __init__(self, field, request, params, model, model_admin,
+                 field_path):
+        self.lookup_kwarg = (
+            f'{field_path}__{field.target_field.name}__exact'
+        )
+        self.lookup_val = params.get(self.lookup_kwarg)
+        super().__init__(
+            field, request, params, model, model_admin, field_path
+        )
+        self.hidden_params = [
+            (name, value) for name, value in request.GET.items()
+            if name not in (self.lookup_kwarg, PAGE_VAR)
+        ]
+        self.form_field = forms.ModelChoiceField(
+            queryset=field.remote_field.model._default_manager.all(),
+            widget=AutocompleteSelect(
+                field,
+                model_admin.admin_site,
+                attrs={'onchange': 'this.form.submit()'},
+            ),
+            required=False,
+        )
+
+    def has_output(self):
+        return True
+
+    def expected_parameters(self):
+        return [self.lookup_kwarg]
+
+    def rendered_widget(self):
+        return self.form_field.widget.render(
+            self.lookup_kwarg, self.lookup_val
+        )
+
+    def choices(self, changelist):
+        yield {
+            'selected': self.lookup_val is None,
+            'query_string': changelist.get_query_string(
+                remove=[self.lookup_kwarg]
+            ),
+            'display': 'Все',
+        }
+
+
+class EstimatedCountPaginator(Paginator):
+    """Пагинатор, который для больших таблиц без фильтров берёт число
+    строк из статистики PostgreSQL вместо COUNT(*).
+
+    Оценка используется, только если она не меньше
+    ADMIN_ESTIMATED_COUNT_THRESHOLD; небольшие таблицы, выборки с
+    фильтрами и другие СУБД считаются точно.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        query = getattr(queryset, 'query', None)
+        connection = connections[getattr(queryset, 'db', 'default')]
+        if (
+            query is not None
+            and connection.vendor == 'postgresql'
+            and not query.where
+            and not query.distinct
+        ):
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT reltuples::bigint FROM pg_class '
+                    'WHERE oid = %s::regclass',
+                    [connection.ops.quote_name(queryset.model._meta.db_table)],
+                )
+                row = cursor.fetchone()
+            if row and row[0] >= settings.ADMIN_ESTIMATED_COUNT_THRESHOLD:
+                return row[0]
+        return super().count
+
+
+class LargeTableAdminMixin:
+    """Настройки списка объектов для таблиц с большим числом строк."""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    @property
+    def media(self):
+        media = super().media
+        if any(
+            isinstance(list_filter, tuple)
+            and issubclass(list_filter[1], AutocompleteFilter)
+            for list_filter in self.list_filter
+        ):
+            media += AutocompleteSelect(None, self.admin_site).media
+        return media
@@ -0,0 +1,65 @@
+from django.conf import settings
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+
+from api.utils.metrics import count_writes
+from recipes.models import Recipe, ShoppingCart
+
+SESSION_CART_KEY = 'purchases'
+
+
+class SessionCart:
+    """Список покупок анонимного пользователя в его сессии.
+
+    Повторяет add_for_user/remove_for_user менеджера ShoppingCart, чтобы
+    представления работали с обоими одинаково; user_id не используется.
+    """
+
+    def __init__(self, session):
+        self.session = session
+
+    @property
+    def recipe_ids(self):
+        return list(self.session.get(SESSION_CART_KEY, []))
+
+    def save(self, recipe_ids):
+        if recipe_ids:
+            self.session[SESSION_CART_KEY] = recipe_ids
+        else:
+            self.session.pop(SESSION_CART_KEY, None)
+
+    def add_for_user(self, user_id, recipe_ids):
+        current = self.recipe_ids
+        added = [pk for pk in dict.fromkeys(recipe_ids) if pk not in current]
+        if len(current) + len(added) > settings.ANONYMOUS_CART_MAX_SIZE:
+            raise ValidationError({
+                'errors': 'В списке покупок не может быть больше '
+                          f'{settings.ANONYMOUS_CART_MAX_SIZE} рецептов.'
+            })
+        if added:
+            self.save(current + added)
+        return added
+
+    def remove_for_user(self, user_id, recipe_ids):
+        current = self.recipe_ids
+        removed = [pk for pk in dict.fromkeys(recipe_ids) if pk in current]
+        if removed:
+            self.save([pk for pk in current if pk not in removed])
+        return removed
+
+    def merge_into(self, user_id):
+        """Переносит рецепты в список покупок пользователя одной вставкой
+        и очищает список в сессии."""
+        recipe_ids = self.recipe_ids
+        if not recipe_ids:
+            return []
+        recipe_ids = list(
+            Recipe.objects.filter(pk__in=recipe_ids).values_list(
+                'id', flat=True
+            )
+        )
+        with transaction.atomic():
+            added = ShoppingCart.objects.add_for_user(user_id, recipe_ids)
+        count_writes(ShoppingCart._meta.model_name, 'add', len(added))
+        self.save([])
+        return added
@@ -0,0 +1,66 @@
+import gzip
+import hashlib
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+from rest_framework.renderers import JSONRenderer
+
+from api.serializers import IngredientSerializer, TagSerializer
+from api.utils.search import VersionedIndex
+from recipes.models import Ingredient, Tag
+
+
+class CatalogCache(VersionedIndex):
+    """Готовый JSON справочника (тегов, ингредиентов) в памяти процесса.
+
+    Ответ сериализуется и сжимается один раз на версию справочника.
+    Версия хранится в кэше default и увеличивается при изменении таблицы;
+    другие процессы замечают её, только если этот кэш общий (см.
+    VersionedIndex).
+    """
+
+    def __init__(self, name, queryset, serializer_class):
+        super().__init__()
+        self.version_cache_key = f'catalog_version:{name}'
+        self.queryset = queryset
+        self.serializer_class = serializer_class
+        self._content = None
+
+    def get_content(self):
+        """Кортеж (json, json в gzip, etag) текущей версии справочника."""
+        self._ensure_built()
+        return self._content
+
+    def _build(self):
+        data = self.serializer_class(self.queryset.all(), many=True).data
+        content = JSONRenderer().render(data)
+        etag = hashlib.sha1(content).hexdigest()
+        self._content = content, gzip.compress(content), etag
+
+    def response(self, request):
+        content, compressed, etag = self.get_content()
+        use_gzip = 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '')
+        if use_gzip:
+            content, etag = compressed, f'{etag}-gzip'
+        etag = f'"{etag}"'
+        if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(content, content_type='application/json')
+            if use_gzip:
+                response['Content-Encoding'] = 'gzip'
+        response['ETag'] = etag
+        response['Cache-Control'] = (
+            f'public, max-age={settings.CATALOG_CACHE_MAX_AGE}, '
+            f'must-revalidate'
+        )
+        patch_vary_headers(response, ('Accept-Encoding', ))
+        return response
+
+
+ingredient_catalog = CatalogCache(
+    'ingredients', Ingredient.objects.all(), IngredientSerializer
+)
+tag_catalog = CatalogCache('tags', Tag.objects.all(), TagSerializer)
@@ -0,0 +1,98 @@
+import io
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import PurePosixPath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from PIL import Image, ImageOps
+
+from recipes.models import Recipe
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.IMAGE_PIPELINE_WORKERS,
+                    thread_name_prefix='recipe-images',
+                )
+    return _executor
+
+
+def save_variant(image, name, image_format, **params):
+    buffer = io.BytesIO()
+    image.save(buffer, image_format, **params)
+    return default_storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def make_recipe_image_variants(recipe_id, image_name):
+    """Создаёт миниатюру и WebP-версию картинки рецепта.
+
+    Ссылки записываются, только если у рецепта всё ещё та же картинка,
+    поэтому устаревшая задача не затрёт результат более новой.
+    """
+    stem = PurePosixPath(image_name).stem
+    try:
+        with default_storage.open(image_name) as file:
+            image = Image.open(file)
+            image.load()
+        image = ImageOps.exif_transpose(image)
+        thumbnail = ImageOps.fit(
+            image.convert('RGB'), settings.RECIPE_THUMBNAIL_SIZE
+        )
+        thumbnail_name = save_variant(
+            thumbnail,
+            f'recipes/thumbnails/{stem}.jpg',
+            'JPEG',
+            quality=settings.RECIPE_THUMBNAIL_QUALITY,
+            optimize=True,
+        )
+        webp_name = save_variant(
+            image,
+            f'recipes/webp/{stem}.webp',
+            'WEBP',
+            quality=settings.RECIPE_WEBP_QUALITY,
+            method=6,
+        )
+        Recipe.objects.filter(pk=recipe_id, image=image_name).update(
+            image_thumbnail=thumbnail_name,
+            image_webp=webp_name,
+        )
+    except Exception:
+        logger.exception(
+            'Не удалось обработать картинку рецепта %s', recipe_id
+        )
+
+
+def run_in_worker(recipe_id, image_name):
+    try:
+        make_recipe_image_variants(recipe_id, image_name)
+    finally:
+        connection.close()
+
+
+def schedule_recipe_image_variants(recipe):
+    """Ставит обработку картинки в очередь после фиксации транзакции.
+
+    При IMAGE_PIPELINE_WORKERS = 0 картинка обрабатывается сразу.
+    """
+    recipe_id, image_name = recipe.pk, recipe.image.name
+
+    def submit():
+        if settings.IMAGE_PIPELINE_WORKERS:
+            get_executor().submit(run_in_worker, recipe_id, image_name)
+        else:
+            make_recipe_image_variants(recipe_id, image_name)
+
+    transaction.on_commit(submit)
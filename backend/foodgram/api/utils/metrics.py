@@ -0,0 +1,89 @@
+"""Метрики Prometheus.
+
+При запуске под gunicorn переменная окружения PROMETHEUS_MULTIPROC_DIR
+указывает на общий каталог: каждый процесс пишет значения в свои файлы,
+а /metrics собирает их вместе (см. gunicorn.conf.py).
+"""
+import hmac
+import os
+from time import perf_counter
+
+from django.conf import settings
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY,
+                               CollectorRegistry, Counter, Histogram,
+                               generate_latest, multiprocess)
+
+REQUEST_LATENCY = Histogram(
+    'foodgram_request_duration_seconds',
+    'Время обработки запроса',
+    ['view', 'action'],
+)
+REQUEST_QUERIES = Histogram(
+    'foodgram_request_db_queries',
+    'Количество запросов к базе за один запрос',
+    ['view', 'action'],
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200, 500),
+)
+SHOPPING_LIST_PDF_DURATION = Histogram(
+    'foodgram_shopping_list_pdf_duration_seconds',
+    'Время генерации PDF списка покупок',
+)
+IMAGE_DECODE_BYTES = Histogram(
+    'foodgram_image_decode_bytes',
+    'Размер картинок, декодированных из base64',
+    buckets=tuple(2 ** power for power in range(12, 25)),
+)
+RELATION_WRITES = Counter(
+    'foodgram_relation_writes_total',
+    'Добавления и удаления избранного, списка покупок и подписок',
+    ['relation', 'operation'],
+)
+
+
+def count_writes(relation, operation, amount=1):
+    if amount:
+        RELATION_WRITES.labels(relation, operation).inc(amount)
+
+
+def get_view_labels(request):
+    """Имя представления и действие DRF (list, retrieve, favorite...)."""
+    match = request.resolver_match
+    if match is None:
+        return 'unmatched', request.method.lower()
+    view_class = getattr(match.func, 'cls', None)
+    if view_class is None:
+        return match.view_name, request.method.lower()
+    actions = getattr(match.func, 'actions', None) or {}
+    return (
+        view_class.__name__,
+        actions.get(request.method.lower(), request.method.lower()),
+    )
+
+
+def observe_request(request, started, queries):
+    view, action = get_view_labels(request)
+    REQUEST_LATENCY.labels(view, action).observe(perf_counter() - started)
+    REQUEST_QUERIES.labels(view, action).observe(queries)
+
+
+def can_read_metrics(request):
+    """Доступ к /metrics: по токену METRICS_TOKEN в заголовке
+    Authorization: Bearer или администратору, вошедшему в админку."""
+    if settings.METRICS_TOKEN:
+        scheme, _, token = request.META.get(
+            'HTTP_AUTHORIZATION', ''
+        ).partition(' ')
+        if scheme.lower() == 'bearer' and hmac.compare_digest(
+            token.encode(), settings.METRICS_TOKEN.encode()
+        ):
+            return True
+    return request.user.is_active and request.user.is_staff
+
+
+def render_metrics():
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,118 @@
+import bisect
+import threading
+from array import array
+from collections import Counter, defaultdict
+
+from django.db import transaction
+
+from api.utils.search import VersionedIndex
+from recipes.models import RecipeIngredient
+
+
+class RecipeIngredientIndex(VersionedIndex):
+    """Обратный индекс «ингредиент → рецепты» для подбора рецептов по
+    имеющимся продуктам.
+
+    Для каждого ингредиента хранится отсортированный массив id рецептов,
+    для каждого рецепта — множество его ингредиентов. Процесс, изменивший
+    рецепт, правит свою копию на месте, остальные перестраивают индекс
+    по новой версии из общего кэша default (см. VersionedIndex).
+    """
+    version_cache_key = 'recipe_ingredient_index_version'
+
+    def __init__(self):
+        super().__init__()
+        self._postings = {}
+        self._recipes = {}
+        self._pending = threading.local()
+
+    def _build(self):
+        postings = defaultdict(lambda: array('q'))
+        recipes = defaultdict(set)
+        for recipe_id, ingredient_id in RecipeIngredient.objects.values_list(
+            'recipe_id', 'ingredient_id'
+        ).order_by('recipe_id').iterator():
+            postings[ingredient_id].append(recipe_id)
+            recipes[recipe_id].add(ingredient_id)
+        self._postings = dict(postings)
+        self._recipes = {
+            recipe_id: frozenset(ingredient_ids)
+            for recipe_id, ingredient_ids in recipes.items()
+        }
+
+    def _remove(self, recipe_id):
+        for ingredient_id in self._recipes.pop(recipe_id, ()):
+            posting = self._postings[ingredient_id]
+            position = bisect.bisect_left(posting, recipe_id)
+            if position < len(posting) and posting[position] == recipe_id:
+                del posting[position]
+
+    def _add(self, recipe_id, ingredient_ids):
+        self._recipes[recipe_id] = frozenset(ingredient_ids)
+        for ingredient_id in ingredient_ids:
+            posting = self._postings.setdefault(ingredient_id, array('q'))
+            posting.insert(bisect.bisect_left(posting, recipe_id), recipe_id)
+
+    def _apply(self, recipe_id, ingredient_ids=()):
+        ingredient_ids = frozenset(ingredient_ids)
+        with self._lock:
+            expected_version = self._version
+            version = self.invalidate()
+            # Правка на месте допустима, только если с момента построения
+            # копии версию не менял никто другой, в том числе другой
+            # процесс через общий кэш. Если ключ версии вытеснен, он
+            # создаётся заново со случайным значением, и копия
+            # перестраивается.
+            if expected_version is None or version != expected_version + 1:
+                self._version = None
+                return
+            self._remove(recipe_id)
+            if ingredient_ids:
+                self._add(recipe_id, ingredient_ids)
+            self._version = version
+
+    def _get_pending(self):
+        if not hasattr(self._pending, 'recipe_ids'):
+            self._pending.recipe_ids = set()
+        return self._pending.recipe_ids
+
+    def _reload_recipe(self, recipe_id):
+        pending = self._get_pending()
+        if recipe_id not in pending:
+            # Уже перечитан предыдущим вызовом после той же фиксации.
+            return
+        pending.discard(recipe_id)
+        ingredient_ids = ()
+        if self._version is not None:
+            ingredient_ids = RecipeIngredient.objects.filter(
+                recipe_id=recipe_id
+            ).values_list('ingredient_id', flat=True)
+        self._apply(recipe_id, ingredient_ids)
+
+    def update_recipe(self, recipe_id):
+        """Перечитывает состав рецепта из базы после фиксации транзакции,
+        поэтому порядок и число вызовов в одной транзакции не важны."""
+        self._get_pending().add(recipe_id)
+        transaction.on_commit(lambda: self._reload_recipe(recipe_id))
+
+    def remove_recipe(self, recipe_id):
+        transaction.on_commit(lambda: self._apply(recipe_id))
+
+    def match(self, ingredient_ids, max_missing=0):
+        """Id рецептов, которым не хватает не больше max_missing
+        ингредиентов: сначала с меньшим числом недостающих, затем с
+        большим числом совпавших, затем более новые."""
+        self._ensure_built()
+        covered = Counter()
+        for ingredient_id in set(ingredient_ids):
+            covered.update(self._postings.get(ingredient_id, ()))
+        ranked = []
+        for recipe_id, count in covered.items():
+            missing = len(self._recipes[recipe_id]) - count
+            if missing <= max_missing:
+                ranked.append((missing, -count, -recipe_id))
+        ranked.sort()
+        return [-recipe_id for _, _, recipe_id in ranked]
+
+
+recipe_ingredient_index = RecipeIngredientIndex()
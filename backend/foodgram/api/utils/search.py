@@ -0,0 +1,198 @@
+import bisect
+import random
+import threading
+from abc import ABC, abstractmethod
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from recipes.models import Ingredient
+
+MIN_SUBSTRING_LENGTH = 3
+SIMILARITY_THRESHOLD = 0.3
+VERSION_BITS = 48
+PROCESS_LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def normalize(text):
+    return text.lower().replace('ё', 'е').strip()
+
+
+def get_trigrams(text, padded=False):
+    trigrams = set()
+    for word in text.split():
+        if padded:
+            word = f'  {word} '
+        trigrams.update(word[i:i + 3] for i in range(len(word) - 2))
+    return trigrams
+
+
+def is_cache_shared():
+    """Видят ли все процессы одни и те же версии индексов в кэше default."""
+    return (
+        settings.CACHES['default']['BACKEND']
+        not in PROCESS_LOCAL_CACHE_BACKENDS
+    )
+
+
+class VersionedIndex(ABC):
+    """Индекс в памяти процесса, общая версия которого хранится в кэше.
+
+    Увеличение версии заставляет каждый процесс перестроить свою копию
+    при следующем обращении. Другие процессы (воркеры gunicorn, команды
+    управления) видят новую версию, только если кэш default общий, например
+    Memcached (CACHE_BACKEND и CACHE_LOCATION); LocMemCache хранит версию
+    в памяти одного процесса, см. проверку api.W001.
+    """
+    version_cache_key = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+
+    @staticmethod
+    def _new_version():
+        # Версия, появившаяся заново (первое обращение или вытеснение ключа
+        # из кэша), не должна совпасть с той, по которой уже построен
+        # индекс в каком-либо процессе.
+        return random.getrandbits(VERSION_BITS)
+
+    def invalidate(self):
+        try:
+            return cache.incr(self.version_cache_key)
+        except ValueError:
+            version = self._new_version()
+            cache.set(self.version_cache_key, version, None)
+            return version
+
+    def current_version(self):
+        return cache.get_or_set(
+            self.version_cache_key, self._new_version, None
+        )
+
+    @abstractmethod
+    def _build(self):
+        """Перестраивает данные индекса из базы."""
+
+    def _ensure_built(self):
+        version = self.current_version()
+        if self._version != version:
+            with self._lock:
+                if self._version != version:
+                    self._build()
+                    self._version = version
+
+
+class IngredientSearchIndex(VersionedIndex):
+    """Поиск ингредиентов по названию без обращения к базе данных.
+
+    Индекс строится при первом поиске и хранит отсортированный список
+    названий для поиска по префиксу и триграммы для поиска по подстроке
+    и с опечатками. Сохранение или удаление ингредиента увеличивает
+    версию индекса в кэше, и каждый процесс перестраивает свою копию.
+    """
+
+    version_cache_key = 'ingredient_search_index_version'
+
+    def __init__(self):
+        super().__init__()
+        self._ingredients = []
+        self._normalized_names = []
+        self._names = []
+        self._trigrams = {}
+        self._padded_trigrams = {}
+        self._padded_trigram_counts = []
+
+    def _build(self):
+        ingredients = [
+            {'id': pk, 'name': name, 'measurement_unit': measurement_unit}
+            for pk, name, measurement_unit in Ingredient.objects.values_list(
+                'id', 'name', 'measurement_unit'
+            )
+        ]
+        normalized_names = [
+            normalize(ingredient['name']) for ingredient in ingredients
+        ]
+        names = sorted(
+            (name, position) for position, name in enumerate(normalized_names)
+        )
+        trigrams = defaultdict(set)
+        padded_trigrams = defaultdict(set)
+        padded_trigram_counts = []
+        for position, name in enumerate(normalized_names):
+            for trigram in get_trigrams(name):
+                trigrams[trigram].add(position)
+            name_trigrams = get_trigrams(name, padded=True)
+            for trigram in name_trigrams:
+                padded_trigrams[trigram].add(position)
+            padded_trigram_counts.append(len(name_trigrams))
+        self._ingredients = ingredients
+        self._normalized_names = normalized_names
+        self._names = names
+        self._trigrams = dict(trigrams)
+        self._padded_trigrams = dict(padded_trigrams)
+        self._padded_trigram_counts = padded_trigram_counts
+
+    def _prefix_matches(self, query):
+        start = bisect.bisect_left(self._names, (query, -1))
+        matches = []
+        for name, position in self._names[start:]:
+            if not name.startswith(query):
+                break
+            matches.append(position)
+        return matches
+
+    def _substring_matches(self, query):
+        trigrams = get_trigrams(query)
+        if len(query) < MIN_SUBSTRING_LENGTH or not trigrams:
+            return []
+        postings = sorted(
+            (self._trigrams.get(trigram, set()) for trigram in trigrams),
+            key=len,
+        )
+        return [
+            position for position in sorted(set.intersection(*postings))
+            if query in self._normalized_names[position]
+        ]
+
+    def _fuzzy_matches(self, query):
+        query_trigrams = get_trigrams(query, padded=True)
+        if len(query) < MIN_SUBSTRING_LENGTH:
+            return []
+        shared = Counter()
+        for trigram in query_trigrams:
+            shared.update(self._padded_trigrams.get(trigram, ()))
+        scored = []
+        for position, count in shared.items():
+            similarity = count / (
+                len(query_trigrams)
+                + self._padded_trigram_counts[position]
+                - count
+            )
+            if similarity >= SIMILARITY_THRESHOLD:
+                scored.append((-similarity, position))
+        return [position for _, position in sorted(scored)]
+
+    def search(self, query):
+        """Ингредиенты, подходящие под query: сначала совпадения по
+        префиксу, затем по подстроке, затем похожие названия."""
+        self._ensure_built()
+        query = normalize(query)
+        if not query:
+            return []
+        found = {}
+        for matches in (
+            self._prefix_matches(query),
+            self._substring_matches(query),
+            self._fuzzy_matches(query),
+        ):
+            for position in matches:
+                found.setdefault(position, self._ingredients[position])
+        return list(found.values())
+
+
+ingredient_index = IngredientSearchIndex()
@@ -0,0 +1,56 @@
+from api.utils.search import VersionedIndex
+from recipes.models import Tag
+
+MAX_ENUMERATED_TAGS = 10
+
+
+class TagCache(VersionedIndex):
+    """Теги в памяти процесса: slug → бит маски рецепта (0, если бита у
+    тега нет)."""
+    version_cache_key = 'tag_cache_version'
+
+    def __init__(self):
+        super().__init__()
+        self._bits = {}
+
+    def _build(self):
+        self._bits = {
+            slug: Tag.get_mask(bit)
+            for slug, bit in Tag.objects.values_list('slug', 'bit')
+        }
+
+    def choices(self):
+        self._ensure_built()
+        return [(slug, slug) for slug in self._bits]
+
+    def get_mask(self, slugs):
+        """Маска тегов slugs или None, если у какого-то из них нет бита."""
+        self._ensure_built()
+        mask = 0
+        for slug in slugs:
+            if not self._bits[slug]:
+                return None
+            mask |= self._bits[slug]
+        return mask
+
+    def get_matching_masks(self, mask):
+        """Все значения tags_mask, пересекающиеся с mask, или None, если
+        тегов слишком много, чтобы перечислить их сочетания.
+
+        Фильтр по списку значений использует индекс по tags_mask.
+        """
+        self._ensure_built()
+        bits = [bit for bit in self._bits.values() if bit]
+        if len(bits) > MAX_ENUMERATED_TAGS:
+            return None
+        masks = [0]
+        for bit in bits:
+            masks += [value | bit for value in masks]
+        return [value for value in masks if value & mask]
+
+
+tag_cache = TagCache()
+
+
+def get_tag_choices():
+    return tag_cache.choices()
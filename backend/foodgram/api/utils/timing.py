@@ -0,0 +1,131 @@
+import math
+import threading
+from collections import defaultdict, deque
+from contextvars import ContextVar
+from time import perf_counter
+
+from django.conf import settings
+
+PERCENTILES = (50, 95, 99)
+
+current_metrics = ContextVar('current_metrics', default=None)
+
+
+class RequestMetrics:
+    """Время, потраченное одним запросом на базу, сериализацию и
+    отрисовку ответа; длительности в миллисекундах.
+
+    Сериализацией считается время работы представления без запросов к
+    базе: от вызова представления до возврата ответа DRF, который ещё
+    не отрисован. Вложенные сериализаторы отдельно не замеряются.
+    """
+
+    def __init__(self):
+        self.started = perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.slowest_query = 0.0
+        self.serializer_time = 0.0
+        self.render_time = 0.0
+        self.render_started = None
+        self.view_started = None
+        self.view_db_time = 0.0
+
+    def record_query(self, execute, sql, params, many, context):
+        started = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = (perf_counter() - started) * 1000
+            self.queries += 1
+            self.db_time += duration
+            self.slowest_query = max(self.slowest_query, duration)
+
+    def start_view(self):
+        self.view_started = perf_counter()
+        self.view_db_time = self.db_time
+
+    def finish_view(self):
+        if self.view_started is None:
+            return
+        view_time = (perf_counter() - self.view_started) * 1000
+        self.serializer_time = max(
+            view_time - (self.db_time - self.view_db_time), 0.0
+        )
+        self.view_started = None
+
+    def start_render(self):
+        self.render_started = perf_counter()
+
+    def finish_render(self, response):
+        if self.render_started is not None:
+            self.render_time += (perf_counter() - self.render_started) * 1000
+
+    @property
+    def total_time(self):
+        return (perf_counter() - self.started) * 1000
+
+    def server_timing(self, total_time):
+        return ', '.join((
+            f'db;dur={self.db_time:.1f};desc="{self.queries} queries"',
+            f'db-slowest;dur={self.slowest_query:.1f}',
+            f'serializer;dur={self.serializer_time:.1f}',
+            f'render;dur={self.render_time:.1f}',
+            f'total;dur={total_time:.1f}',
+        ))
+
+
+class ViewStats:
+    """Скользящие окна последних запросов каждого представления в
+    памяти процесса."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples = defaultdict(self._new_window)
+
+    @staticmethod
+    def _new_window():
+        return deque(maxlen=settings.SERVER_TIMING_WINDOW)
+
+    def add(self, view_name, metrics, total_time):
+        with self._lock:
+            self._samples[view_name].append(
+                (total_time, metrics.db_time, metrics.queries)
+            )
+
+    @staticmethod
+    def percentile(values, percent):
+        return values[max(math.ceil(len(values) * percent / 100) - 1, 0)]
+
+    def summary(self):
+        with self._lock:
+            samples = {
+                view_name: list(window)
+                for view_name, window in self._samples.items()
+            }
+        result = {}
+        for view_name, window in sorted(samples.items()):
+            durations = sorted(total for total, _, _ in window)
+            result[view_name] = {
+                'count': len(window),
+                **{
+                    f'p{percent}': round(
+                        self.percentile(durations, percent), 1
+                    )
+                    for percent in PERCENTILES
+                },
+                'avg_db_time': round(
+                    sum(db_time for _, db_time, _ in window) / len(window), 1
+                ),
+                'avg_queries': round(
+                    sum(queries for _, _, queries in window) / len(window), 1
+                ),
+            }
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+
+
+view_stats = ViewStats()
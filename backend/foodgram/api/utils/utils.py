@@ -1,7 +1,32 @@
+import io
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+from reportlab.lib.utils import simpleSplit
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.pdfgen import canvas
 
+from api.utils.metrics import SHOPPING_LIST_PDF_DURATION
+from api.utils.search import ingredient_index
+
+FONT_NAME = 'Slimamif'
+FONT_PATH = Path(__file__).resolve().parent / 'fonts' / 'Slimamif.ttf'
+TITLE_FONT_SIZE = 24
+FONT_SIZE = 16
+PAGE_TOP = 800
+PAGE_BOTTOM = 50
+LINE_START = 75
+LINE_WIDTH = 460
+LINE_HEIGHT = 25
+
+
+def register_fonts():
+    """Регистрирует шрифт списка покупок один раз на процесс."""
+    if FONT_NAME not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(TTFont(FONT_NAME, FONT_PATH))
+
 
 def get_data_for_shopping_list(items):
     final_list = {}
@@ -12,21 +37,49 @@ def get_data_for_shopping_list(items):
                 'measurement_unit': item['ingredient__measurement_unit'],
                 'amount': item['total']
             }
-    font_path = './api/utils/fonts/Slimamif.ttf'
-    pdfmetrics.registerFont(TTFont('Slimamif', font_path))
     return final_list
 
 
+@SHOPPING_LIST_PDF_DURATION.time()
 def create_shopping_list_pdf(response, final_list):
+    register_fonts()
     page = canvas.Canvas(response)
-    page.setFont('Slimamif', size=24)
-    page.drawString(200, 800, 'Список ингредиентов')
-    page.setFont('Slimamif', size=16)
-    height = 750
+    page.setFont(FONT_NAME, size=TITLE_FONT_SIZE)
+    page.drawString(200, PAGE_TOP, 'Список ингредиентов')
+    page.setFont(FONT_NAME, size=FONT_SIZE)
+    height = PAGE_TOP - 2 * LINE_HEIGHT
     for i, (name, data) in enumerate(final_list.items(), 1):
-        page.drawString(75, height, (f'{i}. {name} - {data["amount"]}, '
-                                     f'{data["measurement_unit"]}'))
-        height -= 25
+        lines = simpleSplit(
+            f'{i}. {name} - {data["amount"]}, {data["measurement_unit"]}',
+            FONT_NAME, FONT_SIZE, LINE_WIDTH
+        )
+        for line in lines:
+            if height < PAGE_BOTTOM:
+                page.showPage()
+                page.setFont(FONT_NAME, size=FONT_SIZE)
+                height = PAGE_TOP
+            page.drawString(LINE_START, height, line)
+            height -= LINE_HEIGHT
     page.showPage()
     page.save()
     return response
+
+
+def get_shopping_list_pdf(cart_key, items):
+    """PDF списка покупок из кэша или свежесгенерированный.
+
+    cart_key меняется вместе с содержимым списка (версия списка покупок
+    пользователя или состав корзины в сессии), а версия индекса
+    ингредиентов — при их переименовании. Поэтому при попадании в кэш
+    запрос items не выполняется и ReportLab не вызывается.
+    """
+    cache_key = (
+        f'shopping_list_pdf:{cart_key}:{ingredient_index.current_version()}'
+    )
+    pdf = cache.get(cache_key)
+    if pdf is None:
+        buffer = io.BytesIO()
+        create_shopping_list_pdf(buffer, get_data_for_shopping_list(items))
+        pdf = buffer.getvalue()
+        cache.set(cache_key, pdf, settings.SHOPPING_LIST_CACHE_TIMEOUT)
+    return pdf
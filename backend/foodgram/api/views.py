@@ -1,24 +1,39 @@
-from django.db.models import F, Sum
+import hashlib
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import (BooleanField, Exists, ExpressionWrapper, F,
+                              OuterRef, Prefetch, Q, Sum, Value, Window)
+from django.db.models.functions import RowNumber
 from django.http import Http404, HttpResponse, JsonResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import mixins, status, viewsets
 from rest_framework.decorators import action
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import (AllowAny, IsAdminUser,
+                                        IsAuthenticated)
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet
 
 from api.filters import IngredientFilter, RecipeFilter
 from api.mixins import CreateAndDeleteMixin
+from api.pagination import PageNumberLimitPagination, RecipePagination
 from api.permissions import IsAuthorOrReadOnly
 from api.serializers import (FollowSerializer, IngredientSerializer,
                              RecipeCreateUpdateSerializer,
-                             RecipeListSerializer, RecipeMinifiedSerializer,
-                             TagSerializer, UserExtendedSerializer)
-from api.utils.utils import (create_shopping_list_pdf,
-                             get_data_for_shopping_list)
+                             RecipeDetailSerializer, RecipeListSerializer,
+                             RecipeMinifiedSerializer, TagSerializer,
+                             UserExtendedSerializer)
+from api.utils.cart import SessionCart
+from api.utils.catalog import ingredient_catalog, tag_catalog
+from api.utils.metrics import can_read_metrics, render_metrics
+from api.utils.pantry import recipe_ingredient_index
+from api.utils.timing import view_stats
+from api.utils.utils import get_shopping_list_pdf
 from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                            ShoppingCart, Tag)
+                            ShoppingCart, ShoppingListItem, Tag)
 from users.models import Follow, User
 
 
@@ -46,9 +61,65 @@ class CustomUserViewSet(
 
     def get_queryset(self):
         if self.request.user.is_authenticated:
-            return User.objects.filter(following__user=self.request.user)
+            return User.objects.filter(
+                following__user=self.request.user
+            ).annotate(
+                is_subscribed=Value(True),
+            ).order_by('email')
         return None
 
+    def get_recipes_limit(self) -> int:
+        recipes_limit = self.request.query_params.get(
+            'recipes_limit', settings.DEFAULT_RECIPES_LIMIT
+        )
+        try:
+            recipes_limit = int(recipes_limit)
+        except (TypeError, ValueError):
+            recipes_limit = -1
+        if recipes_limit < 0:
+            raise ValidationError(
+                {'recipes_limit': 'Укажите неотрицательное целое число.'}
+            )
+        return recipes_limit
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['recipes_limit'] = self.get_recipes_limit()
+        return context
+
+    def attach_latest_recipes(self, authors, recipes_limit):
+        """Последние рецепты всех авторов страницы одним запросом.
+
+        Рецепты нумеруются через ROW_NUMBER() в разрезе автора, в
+        ``latest_recipes`` каждого автора попадают первые recipes_limit.
+        """
+        if not authors:
+            return
+        ranked = Recipe.objects.filter(author__in=authors).annotate(
+            row_number=Window(
+                expression=RowNumber(),
+                partition_by=[F('author_id')],
+                order_by=[F('pub_date').desc(), F('id').desc()],
+            )
+        )
+        sql, params = ranked.query.sql_with_params()
+        row_number = connection.ops.quote_name('row_number')
+        latest_recipes = {author.id: [] for author in authors}
+        for recipe in Recipe.objects.raw(
+            f'SELECT * FROM ({sql}) ranked WHERE {row_number} <= %s '
+            f'ORDER BY {row_number}',
+            (*params, recipes_limit),
+        ):
+            latest_recipes[recipe.author_id].append(recipe)
+        for author in authors:
+            author.latest_recipes = latest_recipes[author.id]
+
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(self.get_queryset())
+        self.attach_latest_recipes(page, self.get_recipes_limit())
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
     def create(self, request, *args, **kwargs):
         request.data.update(author=self.get_author())
         super().create(request, *args, **kwargs)
@@ -82,6 +153,9 @@ class TagsViewSet(ModelViewSet):
 
     http_method_names = ['get', ]
 
+    def list(self, request, *args, **kwargs):
+        return tag_catalog.response(request)
+
 
 class IngredientViewSet(ModelViewSet):
     serializer_class = IngredientSerializer
@@ -90,29 +164,79 @@ class IngredientViewSet(ModelViewSet):
     filter_backends = [IngredientFilter, ]
     search_fields = ['^name', ]
 
+    def list(self, request, *args, **kwargs):
+        if request.query_params.get(IngredientFilter.search_param):
+            return super().list(request, *args, **kwargs)
+        return ingredient_catalog.response(request)
+
 
 class RecipeViewSet(ModelViewSet, CreateAndDeleteMixin):
-    queryset = Recipe.objects.all()
     http_method_names = ['get', 'post', 'patch', 'delete']
     filter_backends = [DjangoFilterBackend, ]
     filterset_class = RecipeFilter
+    pagination_class = RecipePagination
 
     def get_permissions(self):
-        if self.action in (
+        if self.action in ('favorite', 'favorite_batch'):
+            return [IsAuthenticated(), ]
+        elif self.action in (
             'shopping_cart',
-            'favorite',
+            'shopping_cart_batch',
             'download_shopping_cart'
         ):
-            return [IsAuthenticated(), ]
+            return [AllowAny(), ]
         elif self.action == 'destroy':
             return [IsAuthorOrReadOnly(), ]
         return super().get_permissions()
 
+    def get_queryset(self):
+        user = self.request.user
+        authors = User.objects.all()
+        queryset = Recipe.objects.prefetch_related(
+            'tags',
+            Prefetch(
+                'recipeingredient_set',
+                queryset=RecipeIngredient.objects.select_related('ingredient')
+            ),
+        )
+        if user.is_authenticated:
+            authors = authors.annotate(is_subscribed=Exists(
+                Follow.objects.filter(user=user, author=OuterRef('pk'))
+            ))
+            return queryset.prefetch_related(
+                Prefetch('author', queryset=authors)
+            ).annotate(
+                is_favorited=Exists(
+                    Favorite.objects.filter(user=user, recipe=OuterRef('pk'))
+                ),
+                is_in_shopping_cart=Exists(
+                    ShoppingCart.objects.filter(
+                        user=user, recipe=OuterRef('pk')
+                    )
+                ),
+            )
+        cart_recipe_ids = SessionCart(self.request.session).recipe_ids
+        # ExpressionWrapper с пустым id__in не компилируется в Django 3.2.
+        is_in_shopping_cart = ExpressionWrapper(
+            Q(id__in=cart_recipe_ids), output_field=BooleanField()
+        ) if cart_recipe_ids else Value(False)
+        return queryset.select_related('author').annotate(
+            is_favorited=Value(False),
+            is_in_shopping_cart=is_in_shopping_cart,
+        )
+
     def get_serializer_class(self):
         if self.action in ('create', 'update', 'partial_update'):
             return RecipeCreateUpdateSerializer
-        elif self.action in ('shopping_cart', 'favorite'):
+        elif self.action in (
+            'shopping_cart',
+            'favorite',
+            'shopping_cart_batch',
+            'favorite_batch',
+        ):
             return RecipeMinifiedSerializer
+        elif self.action == 'retrieve':
+            return RecipeDetailSerializer
         return RecipeListSerializer
 
     def perform_create(self, serializer):
@@ -138,30 +262,104 @@ class RecipeViewSet(ModelViewSet, CreateAndDeleteMixin):
             field_to_create_or_delete_name='recipe'
         )
 
+    @action(methods=['post', 'delete'], detail=False, url_path='favorite')
+    def favorite_batch(self, request):
+        return self.create_and_delete_related_batch(klass=Favorite)
+
+    @action(
+        methods=['post', 'delete'], detail=False, url_path='shopping_cart'
+    )
+    def shopping_cart_batch(self, request):
+        return self.create_and_delete_related_batch(klass=ShoppingCart)
+
     @action(methods=['get'], detail=False)
-    def download_shopping_cart(self, request):
-        items = RecipeIngredient.objects.select_related(
-            'recipe', 'ingredient'
+    def pantry(self, request):
+        """Рецепты, которые можно приготовить из указанных ингредиентов.
+
+        Параметры: ingredients — id ингредиентов (можно повторять),
+        max_missing — сколько ингредиентов рецепта может не хватать.
+        """
+        try:
+            ingredient_ids = [
+                int(ingredient_id)
+                for ingredient_id in request.query_params.getlist(
+                    'ingredients'
+                )
+            ]
+            max_missing = int(request.query_params.get('max_missing', 0))
+        except ValueError:
+            raise ValidationError(
+                {'errors': 'Параметры должны быть целыми числами.'}
+            )
+        recipe_ids = recipe_ingredient_index.match(
+            ingredient_ids, max_missing
         )
+        paginator = PageNumberLimitPagination()
+        page = paginator.paginate_queryset(recipe_ids, request, self)
+        recipes = self.get_queryset().in_bulk(page)
+        serializer = self.get_serializer(
+            [recipes[pk] for pk in page if pk in recipes], many=True
+        )
+        return paginator.get_paginated_response(serializer.data)
 
+    @action(methods=['get'], detail=False)
+    def download_shopping_cart(self, request):
         if request.user.is_authenticated:
-            items = items.filter(recipe__shopping_carts__user=request.user)
+            version = ShoppingListItem.objects.get_version(request.user.pk)
+            cart_key = f'{request.user.pk}:{version}'
+            items = ShoppingListItem.objects.filter(
+                user=request.user
+            ).values(
+                'ingredient__measurement_unit',
+                name=F('ingredient__name'),
+                total=F('amount'),
+            ).order_by('-total')
         else:
-            items = items.filter(
-                recipe_id__in=request.session['purchases']
+            recipe_ids = SessionCart(request.session).recipe_ids
+            # Одинаковые корзины разных сессий делят один PDF, версия
+            # индекса рецептов меняется при изменении их состава.
+            recipes_hash = hashlib.sha1(
+                ','.join(map(str, sorted(recipe_ids))).encode()
+            ).hexdigest()
+            cart_key = (
+                f'session:{recipes_hash}:'
+                f'{recipe_ingredient_index.current_version()}'
             )
+            items = RecipeIngredient.objects.filter(
+                recipe_id__in=recipe_ids
+            ).values(
+                'ingredient__name', 'ingredient__measurement_unit'
+            ).annotate(
+                name=F('ingredient__name'),
+                units=F('ingredient__measurement_unit'),
+                total=Sum('amount'),
+            ).order_by('-total')
 
-        items = items.values(
-            'ingredient__name', 'ingredient__measurement_unit'
-        ).annotate(
-            name=F('ingredient__name'),
-            units=F('ingredient__measurement_unit'),
-            total=Sum('amount'),
-        ).order_by('-total')
-
-        response = HttpResponse(content_type='application/pdf')
+        pdf = get_shopping_list_pdf(cart_key, items)
+        response = HttpResponse(pdf, content_type='application/pdf')
         response['Content-Disposition'] = ('attachment; '
                                            'filename="shopping_list.pdf"')
-        items_list = get_data_for_shopping_list(items)
-        response = create_shopping_list_pdf(response, items_list)
         return response
+
+
+class PerformanceStatsView(APIView):
+    """Время ответа (p50/p95/p99, мс) и запросы к базе по представлениям
+    за последние SERVER_TIMING_WINDOW запросов этого процесса."""
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return Response(view_stats.summary())
+
+
+def metrics(request):
+    """Метрики в текстовом формате Prometheus, собранные со всех
+    процессов gunicorn; см. can_read_metrics."""
+    if not settings.METRICS_ENABLED:
+        raise Http404
+    if not can_read_metrics(request):
+        return HttpResponse(
+            status=status.HTTP_401_UNAUTHORIZED,
+            headers={'WWW-Authenticate': 'Bearer'},
+        )
+    content, content_type = render_metrics()
+    return HttpResponse(content, content_type=content_type)
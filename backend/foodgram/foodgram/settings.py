@@ -51,6 +51,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'api.middleware.PrometheusMetricsMiddleware',
+    'api.middleware.ServerTimingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -102,12 +104,45 @@ else:
         },
     }
 
+AUTH_TOKEN_CACHE_ALIAS = "auth_tokens"
+AUTH_TOKEN_CACHE_BACKEND = os.getenv(
+    "AUTH_TOKEN_CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+)
+
+CACHES = {
+    # Версии индексов в памяти процессов (api.utils.search.VersionedIndex)
+    # и справочников. Чтобы изменения замечали все воркеры и команды
+    # управления, в работе нужен общий кэш, например
+    # django.core.cache.backends.memcached.PyMemcacheCache.
+    "default": {
+        "BACKEND": os.getenv(
+            "CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": os.getenv("CACHE_LOCATION", ""),
+    },
+    # Токены с пользователями для CachedTokenAuthentication. LocMemCache
+    # ограничен MAX_ENTRIES и хранит записи в памяти процесса; общий бэкенд
+    # (AUTH_TOKEN_CACHE_BACKEND и AUTH_TOKEN_CACHE_LOCATION) нужен, чтобы
+    # выход из аккаунта сразу действовал во всех процессах.
+    AUTH_TOKEN_CACHE_ALIAS: {
+        "BACKEND": AUTH_TOKEN_CACHE_BACKEND,
+        "LOCATION": os.getenv("AUTH_TOKEN_CACHE_LOCATION", "auth-tokens"),
+        "TIMEOUT": int(os.getenv("AUTH_TOKEN_CACHE_TIMEOUT", 60)),
+    },
+}
+if AUTH_TOKEN_CACHE_BACKEND.endswith("LocMemCache"):
+    CACHES[AUTH_TOKEN_CACHE_ALIAS]["OPTIONS"] = {"MAX_ENTRIES": 10000}
+
+# Сессия (в ней живёт список покупок анонимного пользователя) хранится в
+# подписанной cookie и не требует обращений к базе.
+SESSION_ENGINE = "django.contrib.sessions.backends.signed_cookies"
+
 REST_FRAMEWORK = {
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticatedOrReadOnly",
     ],
     "DEFAULT_AUTHENTICATION_CLASSES": [
-        "rest_framework.authentication.TokenAuthentication",
+        "api.authentication.CachedTokenAuthentication",
     ],
     "DEFAULT_PAGINATION_CLASS": "api.pagination.PageNumberLimitPagination",
     "PAGE_SIZE": 6,
@@ -116,8 +151,8 @@ REST_FRAMEWORK = {
 
 DJOSER = {
     "SERIALIZERS": {
-        "user": "api.serializers.UserSerializer",
-        "current_user": "api.serializers.UserSerializer",
+        "user": "api.serializers.CustomUserSerializer",
+        "current_user": "api.serializers.CustomUserSerializer",
     },
     "PERMISSIONS": {
         "user": ["rest_framework.permissions.IsAuthenticated"],
@@ -177,3 +212,19 @@ UNITS_MAX_LENGTH = 200
 SLUG_MAX_LENGTH = 200
 COLOR_MAX_LENGTH = 7
 DEFAULT_RECIPES_LIMIT = 3
+SHOPPING_LIST_CACHE_TIMEOUT = 60 * 60
+CATALOG_CACHE_MAX_AGE = 0
+IMAGE_PIPELINE_WORKERS = int(os.getenv('IMAGE_PIPELINE_WORKERS', 2))
+RECIPE_THUMBNAIL_SIZE = (600, 400)
+RECIPE_THUMBNAIL_QUALITY = 80
+RECIPE_WEBP_QUALITY = 80
+TAG_MASK_BITS = 63
+ADMIN_ESTIMATED_COUNT_THRESHOLD = 10000
+RECIPE_BATCH_MAX_SIZE = 100
+ANONYMOUS_CART_MAX_SIZE = 100
+SERVER_TIMING_ENABLED = os.getenv('SERVER_TIMING_ENABLED', 'False') == 'True'
+SERVER_TIMING_WINDOW = 1000
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'False') == 'True'
+# Токен для сборщика Prometheus (Authorization: Bearer); без него /metrics
+# доступен только администраторам.
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
@@ -0,0 +1,19 @@
+import os
+import shutil
+
+# Каталог, через который процессы gunicorn делят метрики Prometheus;
+# переменная должна быть задана до импорта prometheus_client.
+PROMETHEUS_MULTIPROC_DIR = os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR", "/tmp/foodgram-metrics"
+)
+
+
+def on_starting(server):
+    shutil.rmtree(PROMETHEUS_MULTIPROC_DIR, ignore_errors=True)
+    os.makedirs(PROMETHEUS_MULTIPROC_DIR)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
@@ -1,12 +1,14 @@
 from django.conf import settings
 from django.contrib import admin
 
+from api.utils.admin import AutocompleteFilter, LargeTableAdminMixin
+
 from .models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                     ShoppingCart, Tag)
+                     ShoppingCart, ShoppingListItem, Tag)
 
 
 @admin.register(Ingredient)
-class IngredientAdmin(admin.ModelAdmin):
+class IngredientAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = (
         'pk',
         'name',
@@ -20,7 +22,7 @@ class IngredientAdmin(admin.ModelAdmin):
         'name',
         'measurement_unit',
     )
-    list_filter = ('name',)
+    list_filter = ('measurement_unit',)
     empty_value_display = settings.ADMIN_MODEL_EMPTY_VALUE
 
 
@@ -49,6 +51,7 @@ class RecipeIngredientInline(admin.TabularInline):
     model = RecipeIngredient
     extra = 0
     min_num = 1
+    autocomplete_fields = ('ingredient', )
 
 
 class FavoriteRecipeInline(admin.TabularInline):
@@ -62,11 +65,13 @@ class ShoppingCartInline(admin.TabularInline):
 
 
 @admin.register(Recipe)
-class RecipeAdmin(admin.ModelAdmin):
-    @admin.display(description='Добавлений в избранное')
+class RecipeAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    @admin.display(
+        description='Добавлений в избранное', ordering='favorites_count'
+    )
     def favorite_amount(self, obj):
         """Число добавлений рецепта в избранное для вывода в админке."""
-        return Favorite.objects.filter(recipe=obj).count()
+        return obj.favorites_count
 
     @admin.display(description='Ингредиенты')
     def ingredients_in_recipe(self):
@@ -83,15 +88,22 @@ class RecipeAdmin(admin.ModelAdmin):
     filter_horizontal = ('tags', )
     list_filter = (
         'tags',
-        'author'
+        ('author', AutocompleteFilter),
     )
-    autocomplete_fields = ('ingredients', )
+    list_select_related = ('author', )
+    autocomplete_fields = ('ingredients', 'author')
     inlines = (RecipeIngredientInline, )
     readonly_fields = ('favorite_amount', )
 
+    def save_related(self, request, form, formsets, change):
+        if not change:
+            return super().save_related(request, form, formsets, change)
+        with ShoppingListItem.objects.track_recipes([form.instance.pk]):
+            super().save_related(request, form, formsets, change)
+
 
 @admin.register(RecipeIngredient)
-class RecipeIngredientAdmin(admin.ModelAdmin):
+class RecipeIngredientAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = (
         'pk',
         'recipe',
@@ -100,7 +112,24 @@ class RecipeIngredientAdmin(admin.ModelAdmin):
     )
     list_editable = ('amount',)
     list_filter = (
-        'recipe',
-        'ingredient',
+        ('recipe', AutocompleteFilter),
+        ('ingredient', AutocompleteFilter),
     )
+    list_select_related = ('recipe', 'ingredient')
+    autocomplete_fields = ('recipe', 'ingredient')
     empty_value_display = settings.ADMIN_MODEL_EMPTY_VALUE
+
+    def save_model(self, request, obj, form, change):
+        recipe_ids = {obj.recipe_id, form.initial.get('recipe', obj.recipe_id)}
+        with ShoppingListItem.objects.track_recipes(recipe_ids):
+            super().save_model(request, obj, form, change)
+
+    def delete_model(self, request, obj):
+        with ShoppingListItem.objects.track_recipes([obj.recipe_id]):
+            super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        with ShoppingListItem.objects.track_recipes(
+            queryset.values_list('recipe_id', flat=True)
+        ):
+            super().delete_queryset(request, queryset)
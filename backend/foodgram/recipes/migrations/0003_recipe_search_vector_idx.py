@@ -0,0 +1,35 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.db import migrations
+
+SEARCH_VECTOR_INDEX = GinIndex(
+    fields=['search_vector'], name='recipe_search_vector_idx'
+)
+
+
+def create_search_vector_index(apps, schema_editor):
+    """GIN-индекс по search_vector нужен только PostgreSQL; в SQLite поиск
+    идёт по таблице FTS5 (recipes.search)."""
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.add_index(
+            apps.get_model('recipes', 'Recipe'), SEARCH_VECTOR_INDEX
+        )
+
+
+def drop_search_vector_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.remove_index(
+            apps.get_model('recipes', 'Recipe'), SEARCH_VECTOR_INDEX
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0002_denormalized_fields'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            create_search_vector_index, drop_search_vector_index
+        ),
+    ]
@@ -0,0 +1,104 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import migrations
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from recipes.search import get_search_vector
+
+BATCH_SIZE = 1000
+
+
+def count_related(related_model, field):
+    return Coalesce(
+        Subquery(
+            related_model.objects.filter(
+                **{field: OuterRef('pk')}
+            ).order_by().values(field).annotate(
+                total=Count('pk')
+            ).values('total'),
+            output_field=IntegerField(),
+        ),
+        0,
+    )
+
+
+def allocate_tag_bits(apps, schema_editor):
+    """Выдаёт тегам биты tags_mask по порядку id."""
+    Tag = apps.get_model('recipes', 'Tag')
+    tags = list(Tag.objects.order_by('pk')[:settings.TAG_MASK_BITS])
+    for bit, tag in enumerate(tags):
+        tag.bit = bit
+    Tag.objects.bulk_update(tags, ['bit'])
+
+
+def fill_tags_masks(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    masks = defaultdict(int)
+    for recipe_id, bit in Recipe.tags.through.objects.filter(
+        tag__bit__isnull=False
+    ).values_list('recipe_id', 'tag__bit'):
+        masks[recipe_id] |= 1 << bit
+    Recipe.objects.bulk_update(
+        [Recipe(pk=pk, tags_mask=mask) for pk, mask in masks.items()],
+        ['tags_mask'],
+        batch_size=BATCH_SIZE,
+    )
+
+
+def fill_recipe_counters(apps, schema_editor):
+    apps.get_model('recipes', 'Recipe').objects.update(
+        favorites_count=count_related(
+            apps.get_model('recipes', 'Favorite'), 'recipe'
+        ),
+        in_carts_count=count_related(
+            apps.get_model('recipes', 'ShoppingCart'), 'recipe'
+        ),
+    )
+
+
+def fill_shopping_lists(apps, schema_editor):
+    ShoppingCart = apps.get_model('recipes', 'ShoppingCart')
+    ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+    ShoppingListItem.objects.bulk_create(
+        (
+            ShoppingListItem(
+                user_id=item['user_id'],
+                ingredient_id=item['recipe__recipeingredient__ingredient'],
+                amount=item['total'],
+            )
+            for item in ShoppingCart.objects.filter(
+                recipe__recipeingredient__isnull=False
+            ).values(
+                'user_id', 'recipe__recipeingredient__ingredient'
+            ).annotate(
+                total=Sum('recipe__recipeingredient__amount')
+            ).order_by()
+        ),
+        batch_size=BATCH_SIZE,
+    )
+
+
+def fill_search_vectors(apps, schema_editor):
+    """В SQLite таблица FTS5 заполняется по сигналу post_migrate."""
+    if schema_editor.connection.vendor == 'postgresql':
+        apps.get_model('recipes', 'Recipe').objects.update(
+            search_vector=get_search_vector()
+        )
+
+
+class Migration(migrations.Migration):
+    """Заполняет поля, добавленные в 0002, для уже существующих данных."""
+
+    dependencies = [
+        ('recipes', '0003_recipe_search_vector_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(allocate_tag_bits, migrations.RunPython.noop),
+        migrations.RunPython(fill_tags_masks, migrations.RunPython.noop),
+        migrations.RunPython(fill_recipe_counters, migrations.RunPython.noop),
+        migrations.RunPython(fill_shopping_lists, migrations.RunPython.noop),
+        migrations.RunPython(fill_search_vectors, migrations.RunPython.noop),
+    ]
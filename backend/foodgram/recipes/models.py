@@ -1,8 +1,14 @@
+from collections import defaultdict
+from contextlib import contextmanager
+from uuid import uuid4
+
 from django.conf import settings
+from django.contrib.postgres.search import SearchVectorField
 from django.core import validators
-from django.db import models
+from django.core.cache import cache
+from django.db import connection, models, transaction
 
-from users.models import User
+from users.models import DenormalizedFieldsMixin, User, change_counter
 
 
 class Ingredient(models.Model):
@@ -35,6 +41,28 @@ class Ingredient(models.Model):
         return f'{self.name} - ({self.measurement_unit})'
 
 
+class TagManager(models.Manager):
+    def get_free_bits(self):
+        used = set(self.exclude(bit=None).values_list('bit', flat=True))
+        return [
+            bit for bit in range(settings.TAG_MASK_BITS) if bit not in used
+        ]
+
+    def allocate_bits(self):
+        """Выдаёт свободные биты tags_mask тегам без бита по порядку id,
+        например после загрузки тегов через bulk_create.
+
+        Тегам, которым битов не хватило, бит не выдаётся: рецепты с ними
+        фильтруются через связь с тегами.
+        """
+        free = self.get_free_bits()
+        tags = list(self.filter(bit=None).order_by('pk')[:len(free)])
+        for tag, bit in zip(tags, free):
+            tag.bit = bit
+        self.bulk_update(tags, ['bit'])
+        return {tag.pk: tag.bit for tag in tags}
+
+
 class Tag(models.Model):
     name = models.CharField(
         unique=True,
@@ -62,6 +90,14 @@ class Tag(models.Model):
         max_length=settings.SLUG_MAX_LENGTH,
         help_text='Введите slug',
     )
+    bit = models.PositiveSmallIntegerField(
+        verbose_name='Бит в маске тегов рецепта',
+        unique=True,
+        null=True,
+        editable=False,
+    )
+
+    objects = TagManager()
 
     class Meta:
         ordering = ('name', )
@@ -71,8 +107,42 @@ class Tag(models.Model):
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        if self._state.adding and self.bit is None:
+            self.bit = next(iter(Tag.objects.get_free_bits()), None)
+        super().save(*args, **kwargs)
+
+    @staticmethod
+    def get_mask(bit):
+        """Значение бита тега в Recipe.tags_mask; 0 для тега без бита."""
+        return 0 if bit is None else 1 << bit
+
+
+class RecipeManager(models.Manager):
+    def update_tags_masks(self, recipe_ids):
+        """Пересчитывает tags_mask рецептов по их связям с тегами."""
+        masks = dict.fromkeys(recipe_ids, 0)
+        for recipe_id, bit in self.model.tags.through.objects.filter(
+            recipe_id__in=masks
+        ).values_list('recipe_id', 'tag__bit'):
+            masks[recipe_id] |= Tag.get_mask(bit)
+        self.bulk_update(
+            [
+                self.model(pk=recipe_id, tags_mask=mask)
+                for recipe_id, mask in masks.items()
+            ],
+            ['tags_mask'],
+            batch_size=1000,
+        )
+
+
+class Recipe(DenormalizedFieldsMixin, models.Model):
+    # Варианты картинки записывает фоновая обработка (api.utils.images).
+    denormalized_fields = (
+        'tags_mask', 'favorites_count', 'in_carts_count',
+        'image_thumbnail', 'image_webp',
+    )
 
-class Recipe(models.Model):
     pub_date = models.DateTimeField(
         verbose_name='Дата создания',
         auto_now_add=True,
@@ -95,6 +165,18 @@ class Recipe(models.Model):
         upload_to='recipes/images/',
         help_text='Выберите картинку',
     )
+    image_thumbnail = models.ImageField(
+        verbose_name='Миниатюра картинки',
+        upload_to='recipes/thumbnails/',
+        blank=True,
+        editable=False,
+    )
+    image_webp = models.ImageField(
+        verbose_name='Картинка в формате WebP',
+        upload_to='recipes/webp/',
+        blank=True,
+        editable=False,
+    )
     text = models.TextField(
         verbose_name='Текстовое описание',
         help_text='Введите текстовое описание'
@@ -116,11 +198,44 @@ class Recipe(models.Model):
         verbose_name='Теги',
         help_text='Выберите теги'
     )
+    search_vector = SearchVectorField(
+        verbose_name='Поисковый вектор',
+        null=True,
+        editable=False,
+    )
+    tags_mask = models.BigIntegerField(
+        verbose_name='Битовая маска тегов',
+        default=0,
+        db_index=True,
+        editable=False,
+    )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='Добавлений в избранное',
+        default=0,
+        editable=False,
+    )
+    in_carts_count = models.PositiveIntegerField(
+        verbose_name='Добавлений в список покупок',
+        default=0,
+        editable=False,
+    )
+
+    objects = RecipeManager()
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
-        ordering = ('-pub_date',)
+        ordering = ('-pub_date', '-id')
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='recipe_pub_date_id_idx',
+            ),
+            models.Index(
+                fields=['-favorites_count', '-id'],
+                name='recipe_favorites_count_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -152,6 +267,81 @@ class RecipeIngredient(models.Model):
         return f'{self.ingredient.name} — {self.amount}'
 
 
+class UserRecipeManager(models.Manager):
+    """Массовое добавление и удаление рецептов пользователя.
+
+    Запросы с RETURNING возвращают id рецептов, которые действительно
+    были добавлены или удалены, поэтому счётчик counter_field
+    меняется точно и при параллельных запросах. Сигналы моделей при
+    этом не отправляются.
+    """
+    counter_field = None
+
+    def get_columns(self):
+        return [
+            connection.ops.quote_name(self.model._meta.get_field(name).column)
+            for name in ('user', 'recipe')
+        ]
+
+    def execute_returning(self, sql, params):
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return [row[0] for row in cursor.fetchall()]
+
+    def add_for_user(self, user_id, recipe_ids):
+        if not recipe_ids:
+            return []
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        user_column, recipe_column = self.get_columns()
+        values = ', '.join(['(%s, %s)'] * len(recipe_ids))
+        added = self.execute_returning(
+            f'INSERT INTO {table} ({user_column}, {recipe_column}) '
+            f'VALUES {values} ON CONFLICT DO NOTHING '
+            f'RETURNING {recipe_column}',
+            [
+                value for recipe_id in recipe_ids
+                for value in (user_id, recipe_id)
+            ],
+        )
+        self.recipes_changed(user_id, added, 1)
+        return added
+
+    def remove_for_user(self, user_id, recipe_ids):
+        if not recipe_ids:
+            return []
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        user_column, recipe_column = self.get_columns()
+        placeholders = ', '.join(['%s'] * len(recipe_ids))
+        removed = self.execute_returning(
+            f'DELETE FROM {table} WHERE {user_column} = %s '
+            f'AND {recipe_column} IN ({placeholders}) '
+            f'RETURNING {recipe_column}',
+            [user_id, *recipe_ids],
+        )
+        self.recipes_changed(user_id, removed, -1)
+        return removed
+
+    def recipes_changed(self, user_id, recipe_ids, delta):
+        if recipe_ids:
+            change_counter(
+                Recipe.objects.filter(pk__in=recipe_ids),
+                self.counter_field,
+                delta,
+            )
+
+
+class FavoriteManager(UserRecipeManager):
+    counter_field = 'favorites_count'
+
+
+class ShoppingCartManager(UserRecipeManager):
+    counter_field = 'in_carts_count'
+
+    def recipes_changed(self, user_id, recipe_ids, delta):
+        super().recipes_changed(user_id, recipe_ids, delta)
+        ShoppingListItem.objects.add_recipes(user_id, recipe_ids, delta)
+
+
 class Favorite(models.Model):
     user = models.ForeignKey(
         User,
@@ -167,6 +357,8 @@ class Favorite(models.Model):
         help_text='Выберите рецепт',
     )
 
+    objects = FavoriteManager()
+
     class Meta:
         constraints = [
             models.UniqueConstraint(
@@ -195,6 +387,8 @@ class ShoppingCart(models.Model):
         verbose_name='Рецепт'
     )
 
+    objects = ShoppingCartManager()
+
     class Meta:
         constraints = [
             models.UniqueConstraint(
@@ -207,3 +401,149 @@ class ShoppingCart(models.Model):
 
     def __str__(self):
         return f'В списке покупок {self.recipe} у {self.user}'
+
+
+class ShoppingListItemManager(models.Manager):
+    @staticmethod
+    def _version_cache_key(user_id):
+        return f'shopping_list_version:{user_id}'
+
+    def get_version(self, user_id):
+        """Версия списка покупок пользователя, по которой кэшируется PDF;
+        меняется после фиксации каждого изменения списка."""
+        return cache.get_or_set(
+            self._version_cache_key(user_id), lambda: uuid4().hex, None
+        )
+
+    def bump_versions(self, user_ids):
+        keys = [self._version_cache_key(user_id) for user_id in user_ids]
+        if keys:
+            transaction.on_commit(lambda: cache.delete_many(keys))
+
+    def add_amounts(self, user_ids, amounts):
+        """Прибавляет amounts ({id ингредиента: количество}) к спискам
+        покупок пользователей user_ids; строки, количество в которых
+        не осталось бы положительным, удаляются."""
+        user_ids = list(user_ids)
+        amounts = {
+            ingredient_id: amount
+            for ingredient_id, amount in amounts.items() if amount
+        }
+        if not user_ids or not amounts:
+            return
+        self.bulk_create(
+            [
+                self.model(user_id=user_id, ingredient_id=ingredient_id)
+                for user_id in user_ids
+                for ingredient_id, amount in amounts.items() if amount > 0
+            ],
+            ignore_conflicts=True,
+        )
+        items = self.filter(user_id__in=user_ids, ingredient_id__in=amounts)
+        exhausted = models.Q()
+        for ingredient_id, amount in amounts.items():
+            if amount < 0:
+                exhausted |= models.Q(
+                    ingredient_id=ingredient_id, amount__lte=-amount
+                )
+        # Удаление до UPDATE: иначе количество ушло бы ниже нуля и
+        # нарушило ограничение на поле amount.
+        if exhausted:
+            items.filter(exhausted).delete()
+        items.update(amount=models.F('amount') + models.Case(
+            *(
+                models.When(ingredient_id=ingredient_id, then=amount)
+                for ingredient_id, amount in amounts.items()
+            ),
+            output_field=models.IntegerField(),
+        ))
+        self.bump_versions(user_ids)
+
+    def add_recipes(self, user_id, recipe_ids, sign=1):
+        amounts = RecipeIngredient.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values('ingredient_id').annotate(total=models.Sum('amount'))
+        self.add_amounts(
+            [user_id],
+            {item['ingredient_id']: sign * item['total'] for item in amounts}
+        )
+
+    def remove_recipes(self, user_id, recipe_ids):
+        self.add_recipes(user_id, recipe_ids, sign=-1)
+
+    def change_recipe(self, recipe, old_amounts, new_amounts):
+        """Переносит изменение состава рецепта в списки покупок всех
+        пользователей, у которых рецепт лежит в корзине."""
+        amounts = {
+            ingredient_id: (
+                new_amounts.get(ingredient_id, 0)
+                - old_amounts.get(ingredient_id, 0)
+            )
+            for ingredient_id in {*old_amounts, *new_amounts}
+        }
+        self.add_amounts(
+            ShoppingCart.objects.filter(recipe=recipe).values_list(
+                'user_id', flat=True
+            ),
+            amounts,
+        )
+
+    @staticmethod
+    def _get_recipe_amounts(recipe_ids):
+        amounts = defaultdict(dict)
+        for item in RecipeIngredient.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values('recipe_id', 'ingredient_id').annotate(
+            total=models.Sum('amount')
+        ).order_by():
+            amounts[item['recipe_id']][item['ingredient_id']] = item['total']
+        return amounts
+
+    @contextmanager
+    def track_recipes(self, recipe_ids):
+        """Переносит в списки покупок изменения состава рецептов
+        recipe_ids, сделанные внутри блока в обход сериализатора,
+        например в админке."""
+        recipe_ids = set(recipe_ids)
+        old_amounts = self._get_recipe_amounts(recipe_ids)
+        yield
+        new_amounts = self._get_recipe_amounts(recipe_ids)
+        for recipe_id in recipe_ids:
+            if old_amounts[recipe_id] != new_amounts[recipe_id]:
+                self.change_recipe(
+                    recipe_id, old_amounts[recipe_id], new_amounts[recipe_id]
+                )
+
+
+class ShoppingListItem(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Ингредиент'
+    )
+    amount = models.PositiveIntegerField(
+        verbose_name='Количество ингредиента',
+        default=0,
+    )
+
+    objects = ShoppingListItemManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                name='unique_shopping_list_item_user_ingredient',
+                fields=['user', 'ingredient'],
+            ),
+        ]
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Список покупок'
+
+    def __str__(self):
+        return f'{self.ingredient} — {self.amount} у {self.user}'
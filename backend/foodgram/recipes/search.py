@@ -0,0 +1,133 @@
+import re
+
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector)
+from django.db import connection
+from django.db.models import F, FloatField
+from django.db.models.expressions import RawSQL
+
+SEARCH_CONFIG = 'russian'
+FTS_TABLE = 'recipes_recipe_fts'
+NAME_WEIGHT = 10.0
+
+
+def get_search_vector():
+    return (
+        SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector('text', weight='B', config=SEARCH_CONFIG)
+    )
+
+
+def normalize(text):
+    return text.replace('ё', 'е').replace('Ё', 'Е')
+
+
+def get_fts_query(query):
+    """Запрос FTS5: все слова, каждое как префикс."""
+    return ' '.join(
+        f'"{word}"*' for word in re.findall(r'\w+', normalize(query))
+    )
+
+
+def get_fts_column(column):
+    return f"replace(replace({column}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+def create_search_index(**kwargs):
+    """Создаёт таблицу FTS5 для SQLite и заполняет её рецептами."""
+    if connection.vendor == 'sqlite':
+        rebuild_search_index()
+
+
+def rebuild_search_index():
+    from recipes.models import Recipe
+
+    if connection.vendor == 'postgresql':
+        Recipe.objects.update(search_vector=get_search_vector())
+    elif connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING '
+                f"fts5(name, text, tokenize='unicode61 remove_diacritics 2')"
+            )
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, name, text) '
+                f'SELECT id, {get_fts_column("name")}, '
+                f'{get_fts_column("text")} FROM {Recipe._meta.db_table}'
+            )
+
+
+def update_search_index(recipe):
+    from recipes.models import Recipe
+
+    if connection.vendor == 'postgresql':
+        Recipe.objects.filter(pk=recipe.pk).update(
+            search_vector=get_search_vector()
+        )
+    elif connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT OR REPLACE INTO {FTS_TABLE} (rowid, name, text) '
+                f'VALUES (%s, %s, %s)',
+                [recipe.pk, normalize(recipe.name), normalize(recipe.text)],
+            )
+
+
+def bulk_update_search_index(recipe_ids):
+    """Индексирует рецепты recipe_ids одним запросом (для массовой
+    загрузки, при которой сигналы post_save не отправляются)."""
+    from recipes.models import Recipe
+
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return
+    if connection.vendor == 'postgresql':
+        Recipe.objects.filter(pk__in=recipe_ids).update(
+            search_vector=get_search_vector()
+        )
+    elif connection.vendor == 'sqlite':
+        placeholders = ', '.join(['%s'] * len(recipe_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT OR REPLACE INTO {FTS_TABLE} (rowid, name, text) '
+                f'SELECT id, {get_fts_column("name")}, '
+                f'{get_fts_column("text")} FROM {Recipe._meta.db_table} '
+                f'WHERE id IN ({placeholders})',
+                recipe_ids,
+            )
+
+
+def delete_from_search_index(recipe):
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [recipe.pk]
+            )
+
+
+def search_recipes(queryset, query):
+    """Отбирает рецепты по запросу и сортирует их по релевантности.
+
+    В PostgreSQL используется поле search_vector с GIN-индексом и
+    русской морфологией, в SQLite — таблица FTS5.
+    """
+    if connection.vendor == 'postgresql':
+        search_query = SearchQuery(
+            query, config=SEARCH_CONFIG, search_type='websearch'
+        )
+        return queryset.filter(search_vector=search_query).annotate(
+            rank=SearchRank(F('search_vector'), search_query)
+        ).order_by('-rank', '-pub_date', '-id')
+    fts_query = get_fts_query(query)
+    if not fts_query:
+        return queryset.none()
+    if connection.vendor == 'sqlite':
+        table = queryset.model._meta.db_table
+        return queryset.annotate(rank=RawSQL(
+            f'SELECT bm25({FTS_TABLE}, {NAME_WEIGHT}, 1.0) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND rowid = {table}.id',
+            (fts_query, ),
+            output_field=FloatField(),
+        )).filter(rank__isnull=False).order_by('rank', '-pub_date', '-id')
+    return queryset.filter(name__icontains=query)
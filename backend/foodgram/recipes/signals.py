@@ -0,0 +1,130 @@
+from django.db.models.signals import (m2m_changed, post_delete, post_migrate,
+                                      post_save, pre_delete, pre_save)
+from django.db.models import F
+from django.dispatch import receiver
+
+from users.models import User, change_counter
+
+from .models import Favorite, Recipe, ShoppingCart, ShoppingListItem, Tag
+from .search import (create_search_index, delete_from_search_index,
+                     update_search_index)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def add_to_shopping_list(sender, instance, created, **kwargs):
+    if created:
+        ShoppingListItem.objects.add_recipes(
+            instance.user_id, [instance.recipe_id]
+        )
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def remove_from_shopping_list(sender, instance, **kwargs):
+    ShoppingListItem.objects.remove_recipes(
+        instance.user_id, [instance.recipe_id]
+    )
+
+
+@receiver(post_save, sender=Favorite)
+def increment_favorites_count(sender, instance, created, **kwargs):
+    if created:
+        change_counter(
+            Recipe.objects.filter(pk=instance.recipe_id), 'favorites_count', 1
+        )
+
+
+@receiver(post_delete, sender=Favorite)
+def decrement_favorites_count(sender, instance, **kwargs):
+    change_counter(
+        Recipe.objects.filter(pk=instance.recipe_id), 'favorites_count', -1
+    )
+
+
+@receiver(post_save, sender=ShoppingCart)
+def increment_in_carts_count(sender, instance, created, **kwargs):
+    if created:
+        change_counter(
+            Recipe.objects.filter(pk=instance.recipe_id), 'in_carts_count', 1
+        )
+
+
+@receiver(post_delete, sender=ShoppingCart)
+def decrement_in_carts_count(sender, instance, **kwargs):
+    change_counter(
+        Recipe.objects.filter(pk=instance.recipe_id), 'in_carts_count', -1
+    )
+
+
+@receiver(pre_save, sender=Recipe)
+def remember_recipe_author(sender, instance, **kwargs):
+    if not instance._state.adding:
+        instance._old_author_id = Recipe.objects.filter(
+            pk=instance.pk
+        ).values_list('author_id', flat=True).first()
+
+
+@receiver(post_save, sender=Recipe)
+def update_recipes_count(sender, instance, created, **kwargs):
+    old_author_id = instance.__dict__.pop('_old_author_id', None)
+    if created:
+        change_counter(
+            User.objects.filter(pk=instance.author_id), 'recipes_count', 1
+        )
+    elif old_author_id not in (None, instance.author_id):
+        change_counter(
+            User.objects.filter(pk=old_author_id), 'recipes_count', -1
+        )
+        change_counter(
+            User.objects.filter(pk=instance.author_id), 'recipes_count', 1
+        )
+
+
+@receiver(post_delete, sender=Recipe)
+def decrement_recipes_count(sender, instance, **kwargs):
+    change_counter(
+        User.objects.filter(pk=instance.author_id), 'recipes_count', -1
+    )
+
+
+@receiver(post_save, sender=Recipe)
+def index_recipe(sender, instance, **kwargs):
+    update_search_index(instance)
+
+
+@receiver(post_delete, sender=Recipe)
+def unindex_recipe(sender, instance, **kwargs):
+    delete_from_search_index(instance)
+
+
+@receiver(post_migrate)
+def create_recipe_search_index(sender, **kwargs):
+    if sender.name == 'recipes':
+        create_search_index()
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def update_tags_mask(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == 'pre_clear':
+        instance._cleared_recipe_ids = list(
+            instance.recipes.values_list('id', flat=True)
+        )
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        recipe_ids = [instance.pk]
+    elif action == 'post_clear':
+        recipe_ids = instance.__dict__.pop('_cleared_recipe_ids', [])
+    else:
+        recipe_ids = pk_set
+    Recipe.objects.update_tags_masks(recipe_ids)
+
+
+@receiver(post_delete, sender=Tag)
+def clear_tag_bit(sender, instance, **kwargs):
+    """Убирает бит удалённого тега из масок: каскадное удаление связей
+    не отправляет m2m_changed, а бит может достаться новому тегу."""
+    mask = Tag.get_mask(instance.bit)
+    if mask:
+        Recipe.objects.annotate(
+            tag_bit=F('tags_mask').bitand(mask)
+        ).exclude(tag_bit=0).update(tags_mask=F('tags_mask').bitand(~mask))
@@ -2,15 +2,19 @@ from django.conf import settings
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 
+from api.utils.admin import AutocompleteFilter, LargeTableAdminMixin
+
 from .models import Follow, User
 
 
 @admin.register(User)
-class UserAdmin(BaseUserAdmin):
-    @admin.display(description='Количество подписчиков')
+class UserAdmin(LargeTableAdminMixin, BaseUserAdmin):
+    @admin.display(
+        description='Количество подписчиков', ordering='followers_count'
+    )
     def followers_amount(self, user):
         """Количество подписчиков для вывода в админке."""
-        return user.followers.count()
+        return user.followers_count
     list_display = (
         'email',
         'username',
@@ -58,19 +62,20 @@ class UserAdmin(BaseUserAdmin):
 
 
 @admin.register(Follow)
-class FollowAdmin(admin.ModelAdmin):
+class FollowAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = (
         'pk',
         'user',
         'author',
     )
     search_fields = (
-        'author',
-        'user',
-
+        'author__email',
+        'user__email',
     )
     list_filter = (
-        'author',
-        'user',
+        ('author', AutocompleteFilter),
+        ('user', AutocompleteFilter),
     )
+    list_select_related = ('user', 'author')
+    autocomplete_fields = ('user', 'author')
     empty_value_display = settings.ADMIN_MODEL_EMPTY_VALUE
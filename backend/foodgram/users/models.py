@@ -4,9 +4,41 @@ from django.contrib.auth.validators import ASCIIUsernameValidator
 from django.db import models
 
 
-class User(AbstractUser):
+def change_counter(queryset, field, delta):
+    """Атомарно прибавляет delta к счётчику field у объектов queryset.
+
+    Изменение выполняется одним UPDATE с F(), без чтения значений,
+    поэтому параллельные запросы не теряют обновления. Счётчики,
+    которые ушли бы в минус из-за рассинхронизации, не меняются;
+    их исправляет команда reconcile_counters.
+    """
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    return queryset.update(**{field: models.F(field) + delta})
+
+
+class DenormalizedFieldsMixin:
+    """Не перезаписывает денормализованные поля при полном save().
+
+    Такие поля меняются отдельными UPDATE, и значения в загруженном
+    объекте могут устареть к моменту сохранения.
+    """
+    denormalized_fields = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.denormalized_fields
+            ]
+        super().save(*args, **kwargs)
+
+
+class User(DenormalizedFieldsMixin, AbstractUser):
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name']
+    denormalized_fields = ('followers_count', 'recipes_count')
 
     username = models.CharField(
         verbose_name='Имя пользователя',
@@ -42,6 +74,16 @@ class User(AbstractUser):
         max_length=settings.FIRST_NAME_MAX_LENGTH,
         help_text='Введите имя'
     )
+    followers_count = models.PositiveIntegerField(
+        verbose_name='Количество подписчиков',
+        default=0,
+        editable=False,
+    )
+    recipes_count = models.PositiveIntegerField(
+        verbose_name='Количество рецептов',
+        default=0,
+        editable=False,
+    )
 
     class Meta:
         ordering = ('email', )